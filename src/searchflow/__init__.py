@@ -1,2 +1,2 @@
-from .db import DB
+from .db import DB, get_db, AsyncDB, get_async_db
 from .logger import setup_logger
\ No newline at end of file
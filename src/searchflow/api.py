@@ -1,16 +1,15 @@
 import os
 import time
+import asyncio
 from typing import List
 from fastapi import FastAPI, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional
-from searchflow.db import DB
+from searchflow.db import get_db, get_async_db
 from searchflow import importers, logger
 
-db = DB()
-
 app = FastAPI(
     title="SearchFlow API",
     version="1.0.0",
@@ -46,8 +45,9 @@ async def receive_html(content: HTMLContent):
         url = content.url
         content_length = len(html_content)
 
-        chrome_importer = importers.ChromeImporter(project_name, db=db)
-        chrome_importer.add_web_page(html_content, url)
+        # Extraction and embedding are blocking, run them off the event loop
+        chrome_importer = importers.ChromeImporter(project_name, db=get_db())
+        await asyncio.to_thread(chrome_importer.add_web_page, html_content, url)
         
         print(project_name)
         # Here you can add your processing logic for the HTML content
@@ -65,7 +65,7 @@ async def receive_html(content: HTMLContent):
     
 @app.get("/projects", response_model=List[str])
 async def get_projects():
-    return db.list_projects()
+    return await get_async_db().list_projects()
 
 
 @app.get("/models/1")
@@ -1,4 +1,6 @@
-from .postgresql import DB
+from .postgresql import DB, get_db, hash_content
 from .tables import Tables
+from .async_postgresql import AsyncDB, get_async_db
+from .filters import SearchFilter
 
-__all__ = ['DB', 'Tables']
\ No newline at end of file
+__all__ = ['DB', 'get_db', 'AsyncDB', 'get_async_db', 'Tables', 'hash_content', 'SearchFilter']
\ No newline at end of file
@@ -0,0 +1,542 @@
+import uuid
+import asyncio
+import threading
+from datetime import datetime
+from typing import List, Dict, Optional, Set, Tuple, BinaryIO
+import pytz
+from sqlalchemy import select, delete, update, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain_core.documents import Document
+from searchflow import logger
+from searchflow.db.engine import get_async_engine
+from searchflow.db.filters import SearchFilter
+from searchflow.db.postgresql import DB, get_db, batched, _config_cache, CONFIG_CHANNEL, PROMPT_COLUMNS
+
+
+_async_db: Optional["AsyncDB"] = None
+_async_db_lock = threading.Lock()
+
+
+def get_async_db() -> "AsyncDB":
+    """
+    Return the AsyncDB shared by the whole process, created on first use.
+    """
+    global _async_db
+    if _async_db is None:
+        with _async_db_lock:
+            if _async_db is None:
+                _async_db = AsyncDB()
+    return _async_db
+
+
+class AsyncDB:
+    """
+    The async counterpart of DB for the API and the graph, on AsyncSession and asyncpg.
+
+    It shares its configuration, caches, embeddings and object store with a sync DB. Work that is not
+    database I/O (chunking, embedding documents, object storage calls, the batched project teardown)
+    runs in a worker thread, so it never blocks the event loop.
+
+    Args:
+        db (DB, optional): The sync DB to share the configuration with, defaults to get_db().
+    """
+    def __init__(self, db: Optional[DB] = None):
+        self.db = db or get_db()
+        self.tables = self.db.tables
+        self.logger = logger.setup_logger(name="AsyncDB", level="WARNING")
+
+    def Session(self) -> AsyncSession:
+        '''
+        Return a new session on the async engine of the running event loop
+        '''
+        return AsyncSession(get_async_engine(self.db.async_db_url), expire_on_commit=False)
+
+    # Projects
+
+    async def list_projects(self) -> List[str]:
+        '''
+        List all projects in the database
+        '''
+        async with self.Session() as session:
+            result = await session.execute(select(self.tables.Project.name))
+            return list(result.scalars())
+
+    async def create_project(self, name: str, description: str) -> str | None:
+        '''
+        Add a new project with its vector collection and storage bucket
+
+        returns:
+            str: The name of the project, None if it could not be created
+        '''
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    existing = await session.get(self.tables.Project, name)
+                    if existing:
+                        self.logger.error(f"Project with name '{name}' already exists. Skipping creation.")
+                        return existing.name
+                    session.add(self.tables.Project(name=name, description=description))
+                    await session.execute(
+                        text("INSERT INTO langchain_pg_collection (uuid, name) VALUES (:uuid, :name) ON CONFLICT (name) DO NOTHING"),
+                        {"uuid": uuid.uuid4(), "name": name}
+                    )
+                    await self._notify_config_change(session)
+            DB._invalidate_vectorstore(name)
+            await asyncio.to_thread(self.db.storage.create_bucket, name)
+            self.logger.info(f"Added new project: {name}")
+            return name
+        except Exception as e:
+            self.logger.error(f"Error adding project: {e}")
+            return None
+
+    async def remove_project(self, project_name: str) -> bool:
+        '''
+        Remove a project and all its data, see DB.remove_project
+        '''
+        return await asyncio.to_thread(self.db.remove_project, project_name)
+
+    # Links
+
+    async def add_links_to_index(self, status: str, links: List[str], base_url: str, project_name: str) -> None:
+        '''
+        Add a list of links to the database, links already known for the project get the new status and base URL
+        '''
+        IndexedLinks = self.tables.IndexedLinks
+        now = datetime.now(pytz.UTC)
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    for batch in batched(dict.fromkeys(links), self.db.bulk_batch_size):
+                        stmt = insert(IndexedLinks).values([
+                            {"url": link, "status": status, "base_url": base_url, "project_name": project_name, "creation_date": now, "update_date": now}
+                            for link in batch
+                        ])
+                        await session.execute(stmt.on_conflict_do_update(
+                            constraint="uq_url_project",
+                            set_={"status": stmt.excluded.status, "base_url": stmt.excluded.base_url, "update_date": stmt.excluded.update_date}
+                        ))
+        except Exception as e:
+            self.logger.error(f"Error adding links to confirm: {e}")
+
+    async def remove_indexed_link(self, url: str, project_name: str) -> None:
+        '''
+        Remove an indexed link from the database
+        '''
+        IndexedLinks = self.tables.IndexedLinks
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    await session.execute(delete(IndexedLinks).where(IndexedLinks.url == url, IndexedLinks.project_name == project_name))
+        except Exception as e:
+            self.logger.error(f"Error removing indexed link: {e}")
+
+    async def get_indexing_status(self, project_name: str) -> List[dict] | None:
+        '''
+        Get the scrape status of all links for a project, grouped by project_name and status
+        '''
+        IndexedLinks = self.tables.IndexedLinks
+        try:
+            async with self.Session() as session:
+                result = await session.execute(
+                    select(
+                        IndexedLinks.project_name,
+                        IndexedLinks.status,
+                        IndexedLinks.base_url,
+                        func.max(IndexedLinks.update_date).label("last_update")
+                    ).where(IndexedLinks.project_name == project_name
+                    ).group_by(IndexedLinks.project_name, IndexedLinks.status, IndexedLinks.base_url)
+                )
+                return [row._asdict() for row in result]
+        except Exception as e:
+            self.logger.error(f"Error getting scrape status: {e}")
+            return None
+
+    async def list_links_by_status(self, project_name: str, status: str, limit: int = 1000, after_id: Optional[int] = None) -> List[dict]:
+        '''
+        List the links of a project with a given status one page at a time, ordered by id
+        '''
+        IndexedLinks = self.tables.IndexedLinks
+        query = select(IndexedLinks.id, IndexedLinks.url, IndexedLinks.base_url).where(
+            IndexedLinks.project_name == project_name,
+            IndexedLinks.status == status
+        )
+        if after_id is not None:
+            query = query.where(IndexedLinks.id > after_id)
+        async with self.Session() as session:
+            result = await session.execute(query.order_by(IndexedLinks.id).limit(limit))
+            return [row._asdict() for row in result]
+
+    async def get_links_to_confirm(self, project_name: str) -> List[dict] | None:
+        '''
+        Return a list of all links that can be confirmed for scraping, read in pages of DB_BULK_BATCH_SIZE links
+        '''
+        try:
+            links = []
+            after_id = None
+            while True:
+                page = await self.list_links_by_status(project_name, "Confirm page import", limit=self.db.bulk_batch_size, after_id=after_id)
+                links.extend({"url": link["url"], "base_url": link["base_url"]} for link in page)
+                if len(page) < self.db.bulk_batch_size:
+                    return links
+                after_id = page[-1]["id"]
+        except Exception as e:
+            self.logger.error(f"Error getting links to confirm: {e}")
+            return None
+
+    async def update_indexed_link_statuses(self, urls: List[str], project_name: str, status: str) -> int:
+        '''
+        Set the status of many links of a project, with one UPDATE per batch of DB_BULK_BATCH_SIZE URLs
+        '''
+        IndexedLinks = self.tables.IndexedLinks
+        updated = 0
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    now = datetime.now(pytz.UTC)
+                    for batch in batched(dict.fromkeys(urls), self.db.bulk_batch_size):
+                        result = await session.execute(
+                            update(IndexedLinks).where(
+                                IndexedLinks.project_name == project_name, IndexedLinks.url.in_(batch)
+                            ).values(status=status, update_date=now)
+                        )
+                        updated += result.rowcount
+            return updated
+        except Exception as e:
+            self.logger.error(f"Error updating indexed link statuses: {e}")
+            return 0
+
+    async def update_indexed_link_status(self, url: str, project_name: str, status: str) -> None:
+        '''
+        Update the status of an indexed link
+        '''
+        await self.update_indexed_link_statuses([url], project_name, status)
+
+    # Documents
+
+    async def filter_indexed_urls(self, project_name: str, urls: List[str]) -> Set[str]:
+        '''
+        Return the URLs of a batch of candidates that are already indexed in a project
+        '''
+        Documents = self.tables.Documents
+        indexed = set()
+        async with self.Session() as session:
+            for batch in batched(dict.fromkeys(urls), self.db.bulk_batch_size):
+                result = await session.execute(
+                    select(Documents.url).where(Documents.project_name == project_name, Documents.url.in_(batch))
+                )
+                indexed.update(result.scalars())
+        return indexed
+
+    async def get_document_hashes(self, project_name: str, urls: List[str]) -> Dict[str, str]:
+        '''
+        Return the stored content hash of every known document in a project, by URL
+        '''
+        Documents = self.tables.Documents
+        hashes = {}
+        async with self.Session() as session:
+            for batch in batched(dict.fromkeys(urls), self.db.bulk_batch_size):
+                result = await session.execute(
+                    select(Documents.url, Documents.content_hash).where(
+                        Documents.project_name == project_name,
+                        Documents.url.in_(batch),
+                        Documents.content_hash.isnot(None)
+                    )
+                )
+                hashes.update({row.url: row.content_hash for row in result})
+        return hashes
+
+    async def add_documents(self, documents: List[Document], project_name: str) -> None:
+        '''
+        Chunk, embed and store documents, see DB.add_documents
+        '''
+        await asyncio.to_thread(self.db.add_documents, documents, project_name)
+
+    async def remove_by_urls(self, project_name: str, urls: List[str], include_metadata: bool = False) -> None:
+        '''
+        Remove the chunks of a set of URLs from a project, and optionally their documents
+        '''
+        Documents = self.tables.Documents
+        delete_chunks = text("""
+            DELETE FROM langchain_pg_embedding
+            WHERE collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = :project_name)
+            AND cmetadata->>'url' = ANY(:urls)
+        """)
+        async with self.Session() as session:
+            async with session.begin():
+                for batch in batched(dict.fromkeys(urls), self.db.bulk_batch_size):
+                    if include_metadata:
+                        await session.execute(delete(Documents).where(Documents.project_name == project_name, Documents.url.in_(batch)))
+                    await session.execute(delete_chunks, {"urls": batch, "project_name": project_name})
+
+    async def get_collection_statistics(self, project_name: str) -> dict:
+        '''
+        Return the document counts of a project, see DB.get_collection_statistics
+        '''
+        Documents = self.tables.Documents
+        async with self.Session() as session:
+            totals = (await session.execute(
+                select(
+                    func.count(Documents.id).label("documents"),
+                    func.count(func.distinct(Documents.source)).label("sources"),
+                    func.count(func.distinct(Documents.file_type)).label("formats"),
+                ).where(Documents.project_name == project_name)
+            )).one()
+            breakdowns = {}
+            for column in (Documents.source, Documents.file_type):
+                result = await session.execute(
+                    select(column, func.count(Documents.id)).where(Documents.project_name == project_name
+                    ).group_by(column).order_by(func.count(Documents.id).desc())
+                )
+                breakdowns[column.key] = {value: count for value, count in result}
+        return {
+            "documents": totals.documents,
+            "sources": totals.sources,
+            "formats": totals.formats,
+            "by_source": breakdowns["source"],
+            "by_file_type": breakdowns["file_type"],
+        }
+
+    async def list_documents(self, project_name: str, limit: int = 100, after_id: Optional[int] = None) -> List[dict]:
+        '''
+        List the documents of a project one page at a time, ordered by id
+        '''
+        Documents = self.tables.Documents
+        query = select(Documents.id, Documents.title, Documents.source, Documents.file_type, Documents.url).where(
+            Documents.project_name == project_name
+        )
+        if after_id is not None:
+            query = query.where(Documents.id > after_id)
+        async with self.Session() as session:
+            result = await session.execute(query.order_by(Documents.id).limit(limit))
+            return [row._asdict() for row in result]
+
+    # Vector search
+
+    async def similarity_search(
+            self,
+            question: str,
+            project_name: str,
+            k: int = 3,
+            search_filter: Optional[SearchFilter | dict] = None,
+            **kwargs
+            ) -> List[Tuple[Document, float]]:
+        '''
+        Search a project for the chunks most similar to a question, see DB.asimilarity_search
+        '''
+        return await self.db.asimilarity_search(question=question, project_name=project_name, k=k, search_filter=search_filter, **kwargs)
+
+    async def hybrid_search(
+            self,
+            question: str,
+            project_name: str,
+            k: int = 3,
+            search_filter: Optional[SearchFilter | dict] = None,
+            **kwargs
+            ) -> List[Tuple[Document, float]]:
+        '''
+        Search a project with both vector and full-text search, see DB.ahybrid_search
+        '''
+        return await self.db.ahybrid_search(question=question, project_name=project_name, k=k, search_filter=search_filter, **kwargs)
+
+    # Prompts and API keys
+
+    async def get_prompt_by_name(self, name: str) -> str | None:
+        '''
+        Get a prompt by its name, cached for CONFIG_CACHE_TTL seconds
+        '''
+        cached = _config_cache.get(("prompt", name))
+        if cached is not None:
+            return cached
+        try:
+            async with self.Session() as session:
+                prompt = (await session.execute(
+                    select(self.tables.Prompt.prompt).where(self.tables.Prompt.name == name).limit(1)
+                )).scalar()
+            if prompt is None:
+                self.logger.error(f"No prompt found with name: {name}")
+                return None
+            _config_cache.set(("prompt", name), prompt)
+            return prompt
+        except Exception as e:
+            self.logger.error(f"Error retrieving prompt by name: {e}")
+            return None
+
+    async def get_all_prompts(self) -> list:
+        '''
+        Retrieve all prompts, cached for CONFIG_CACHE_TTL seconds, see DB.get_all_prompts
+        '''
+        rows = _config_cache.get(("prompts",))
+        if rows is None:
+            async with self.Session() as session:
+                prompts = (await session.execute(select(self.tables.Prompt))).scalars()
+                rows = tuple(tuple(getattr(prompt, column) for column in PROMPT_COLUMNS) for prompt in prompts)
+            _config_cache.set(("prompts",), rows)
+        return [self.tables.Prompt(**dict(zip(PROMPT_COLUMNS, row))) for row in rows]
+
+    async def add_prompt(self, name: str, prompt_text: str) -> int | None:
+        '''
+        Add a new prompt, returns its id
+        '''
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    prompt = self.tables.Prompt(name=name, prompt=prompt_text)
+                    session.add(prompt)
+                    await session.flush()
+                    await self._notify_config_change(session)
+            _config_cache.clear()
+            return prompt.id
+        except Exception as e:
+            self.logger.error(f"Error adding prompt: {e}")
+            return None
+
+    async def update_prompt(self, prompt_id: int, name: Optional[str] = None, prompt_text: Optional[str] = None) -> bool:
+        '''
+        Update the name and/or text of a prompt, returns False if it does not exist
+        '''
+        values = {"update_date": datetime.now(pytz.UTC)}
+        if name:
+            values["name"] = name
+        if prompt_text:
+            values["prompt"] = prompt_text
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        update(self.tables.Prompt).where(self.tables.Prompt.id == prompt_id).values(**values)
+                    )
+                    await self._notify_config_change(session)
+            _config_cache.clear()
+            return result.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error updating prompt: {e}")
+            return False
+
+    async def remove_prompt(self, prompt_id: int) -> bool:
+        '''
+        Remove a prompt, returns False if it does not exist
+        '''
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    result = await session.execute(delete(self.tables.Prompt).where(self.tables.Prompt.id == prompt_id))
+                    await self._notify_config_change(session)
+            _config_cache.clear()
+            return result.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error removing prompt: {e}")
+            return False
+
+    async def add_api_key(self, name: str, key: str) -> int | None:
+        '''
+        Add a new API key, returns its id
+        '''
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    api_key = self.tables.APIKeys(name=name, key=key)
+                    session.add(api_key)
+                    await session.flush()
+                    await self._notify_config_change(session)
+            _config_cache.clear()
+            return api_key.id
+        except Exception as e:
+            self.logger.error(f"Error adding API key: {e}")
+            return None
+
+    async def remove_api_key(self, name: str) -> bool:
+        '''
+        Remove an API key by its name, returns False if it does not exist
+        '''
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    result = await session.execute(delete(self.tables.APIKeys).where(self.tables.APIKeys.name == name))
+                    await self._notify_config_change(session)
+            _config_cache.clear()
+            return result.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error removing API key: {e}")
+            return False
+
+    async def get_api_key_by_name(self, name: str) -> str | None:
+        '''
+        Get an API key by its name, cached for CONFIG_CACHE_TTL seconds
+        '''
+        cached = _config_cache.get(("api_key", name))
+        if cached is not None:
+            return cached
+        try:
+            async with self.Session() as session:
+                key = (await session.execute(
+                    select(self.tables.APIKeys.key).where(self.tables.APIKeys.name == name).limit(1)
+                )).scalar()
+            if key is None:
+                self.logger.error(f"No API key found with name: {name}")
+                return None
+            _config_cache.set(("api_key", name), key)
+            return key
+        except Exception as e:
+            self.logger.error(f"Error retrieving API key by name: {e}")
+            return None
+
+    async def _notify_config_change(self, session: AsyncSession) -> None:
+        if self.db.cache_notify:
+            await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CONFIG_CHANNEL})
+
+    # Files
+
+    async def add_file(self, project_name: str, document_data: Tuple[bytes | BinaryIO, str]) -> str:
+        '''
+        Upload a file to the object store of a project, returns its path in the project bucket
+        '''
+        return await asyncio.to_thread(self.db.add_file, project_name, document_data)
+
+    async def list_files(self, project_name: str) -> List[dict] | None:
+        '''
+        List all uploaded files for a project with a signed download URL
+        '''
+        Documents = self.tables.Documents
+        try:
+            async with self.Session() as session:
+                files = (await session.execute(
+                    select(Documents.url, Documents.filename, Documents.creation_date, Documents.last_modified_date).where(
+                        Documents.project_name == project_name, Documents.source == "uploaded_file"
+                    )
+                )).all()
+            signed_urls = await asyncio.to_thread(self.db._sign_urls, project_name, [file.url for file in files])
+            return [
+                {
+                    "filename": file.filename,
+                    "signed_download_url": signed_urls.get(file.url),
+                    "creation_date": file.creation_date,
+                    "last_modified_date": file.last_modified_date
+                }
+                for file in files
+            ]
+        except Exception as e:
+            self.logger.error(f"Error listing uploaded files: {e}")
+            return None
+
+    async def remove_file(self, project_name: str, file_name: str) -> None:
+        '''
+        Remove an uploaded file from the object store and the database
+        '''
+        Documents = self.tables.Documents
+        try:
+            async with self.Session() as session:
+                url = (await session.execute(
+                    select(Documents.url).where(
+                        Documents.project_name == project_name, Documents.filename == file_name, Documents.source == "uploaded_file"
+                    ).limit(1)
+                )).scalar()
+            if url is None:
+                self.logger.error(f"Error removing uploaded file: {file_name} not found")
+                return None
+            await asyncio.to_thread(self.db.storage.remove, project_name, [url])
+            self.db.signed_urls.pop((project_name, url))
+            await self.remove_by_urls(project_name, [url], include_metadata=True)
+            self.logger.info(f"Removed uploaded file: {file_name}")
+        except Exception as e:
+            self.logger.error(f"Error removing uploaded file: {e}")
@@ -0,0 +1,108 @@
+import time
+import select
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from searchflow import logger
+
+
+class TTLCache:
+    """
+    A small thread-safe LRU cache with an optional time-to-live per entry.
+
+    Args:
+        maxsize (int): The maximum number of entries, the least recently used entry is evicted first.
+            A maxsize of 0 disables the cache.
+        ttl (float, optional): The number of seconds an entry stays valid. None keeps entries until evicted.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Background thread that LISTENs on a Postgres channel and calls on_notify for every notification,
+    so caches in other processes are invalidated when one process writes.
+
+    The callback also runs after every (re)connect, since notifications sent while disconnected are lost.
+
+    Args:
+        connect (Callable): Returns a new psycopg2 connection outside any pool, used only for listening.
+        channel (str): The notification channel.
+        on_notify (Callable): Called without arguments when the cache should be invalidated.
+        retry_interval (float): The number of seconds to wait before reconnecting after an error.
+    """
+    def __init__(self, connect: Callable, channel: str, on_notify: Callable[[], None], retry_interval: float = 5):
+        super().__init__(name=f"listen-{channel}", daemon=True)
+        self.connect = connect
+        self.channel = channel
+        self.on_notify = on_notify
+        self.retry_interval = retry_interval
+        self.logger = logger.setup_logger(name="InvalidationListener", level="WARNING")
+
+    def run(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                self.on_notify()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.on_notify()
+            except Exception as e:
+                self.logger.warning(f"Lost the {self.channel} listener connection, reconnecting: {e}")
+                time.sleep(self.retry_interval)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
@@ -0,0 +1,142 @@
+import os
+import copy
+import uuid
+import hashlib
+import threading
+import multiprocessing
+from functools import lru_cache, partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+# Namespace of the chunk ids, a chunk id is a uuid5 of the project, URL, position and content of the chunk
+CHUNK_ID_NAMESPACE = uuid.UUID("0f3c5e2a-8b1d-5d4e-9a6f-2c7b8e9d1a3f")
+
+# Batches of at least this many documents are split in the process pool
+PARALLEL_THRESHOLD = int(os.getenv('CHUNKING_PARALLEL_THRESHOLD', 500))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+# Average characters per token, chunk sizes are converted with it when chunks are measured in characters
+CHARS_PER_TOKEN = 4
+
+VALID_TOKENIZERS = ['tiktoken', 'characters']
+
+
+def chunking_tokenizer() -> str:
+    """
+    Return how chunks are measured, from CHUNKING_TOKENIZER: "tiktoken" counts tokens with the model's BPE,
+    "characters" counts characters (CHARS_PER_TOKEN per token) and needs no download. Defaults to "characters"
+    with EMBEDDING_PROVIDER=hashing, so offline runs need no network, and to "tiktoken" otherwise.
+
+    tiktoken downloads its BPE file on first use. For offline deployments that should chunk by tokens,
+    put the file in TIKTOKEN_CACHE_DIR beforehand.
+    """
+    default = 'characters' if os.getenv('EMBEDDING_PROVIDER', 'cohere').lower() == 'hashing' else 'tiktoken'
+    tokenizer = os.getenv('CHUNKING_TOKENIZER', default).lower()
+    if tokenizer not in VALID_TOKENIZERS:
+        raise ValueError(f"Invalid chunking tokenizer: {tokenizer}. Valid tokenizers are {VALID_TOKENIZERS}")
+    return tokenizer
+
+
+@lru_cache(maxsize=32)
+def get_text_splitter(model_name: str = "gpt-4", chunk_size: int = 1000, chunk_overlap: int = 0, tokenizer: str = "tiktoken") -> RecursiveCharacterTextSplitter:
+    """
+    Return the splitter for a model, chunk size, overlap and tokenizer (see chunking_tokenizer), built once per process.
+    """
+    if tokenizer == "characters":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size * CHARS_PER_TOKEN,
+            chunk_overlap=chunk_overlap * CHARS_PER_TOKEN,
+        )
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=model_name,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+
+def chunk_id(project_name: str, url: str, position: int, content: str) -> str:
+    """
+    Return the deterministic id of a chunk, so ingesting the same document again upserts the same rows.
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{project_name}|{url}|{position}|{content_hash}"))
+
+
+def split_texts(texts: List[str], model_name: str = "gpt-4", chunk_size: int = 1000, chunk_overlap: int = 0, tokenizer: str = "tiktoken") -> List[List[str]]:
+    """
+    Split every text into chunks, returns the chunks per text in the order of the texts.
+    """
+    splitter = get_text_splitter(model_name, chunk_size, chunk_overlap, tokenizer)
+    return [splitter.split_text(text) for text in texts]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Return the chunking process pool, started on first use with CHUNKING_PROCESSES workers (all cores by default).
+    Workers are spawned rather than forked, since the parent usually runs threads that hold locks.
+    """
+    global _pool, _pool_workers
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool_workers = int(os.getenv('CHUNKING_PROCESSES', 0)) or os.cpu_count()
+                _pool = ProcessPoolExecutor(
+                    max_workers=_pool_workers,
+                    mp_context=multiprocessing.get_context(os.getenv('CHUNKING_MP_CONTEXT', 'spawn')),
+                )
+    return _pool
+
+
+def chunk_content(
+        documents: List[Document],
+        chunk_size: int = 1000,
+        chunk_overlap: int = 0,
+        model_name: str = "gpt-4",
+        parallel: Optional[bool] = None,
+        tokenizer: Optional[str] = None
+        ) -> List[Document]:
+    """
+    Chunk the content of the pages into smaller chunks. Will also add deterministic UUIDs to the chunks,
+    derived from the project, URL, position and content of the chunk (see chunk_id).
+
+    Args:
+        chunk_size (int): The maximum size of each chunk in tokens. Defaults to 1000.
+        chunk_overlap (int): The number of tokens shared by consecutive chunks. Defaults to 0.
+        model_name (str): The model whose tokenizer measures the chunks. Defaults to "gpt-4".
+        parallel (bool, optional): Split the documents in the process pool. Defaults to True for batches
+            of at least CHUNKING_PARALLEL_THRESHOLD documents on machines with more than one core.
+        tokenizer (str, optional): "tiktoken" or "characters", defaults to CHUNKING_TOKENIZER (see chunking_tokenizer).
+
+    Returns:
+        list: A list of chunks containing the content of the pages, in the order of the documents.
+    """
+    content = [' '.join(doc.page_content.split()) for doc in documents]
+    tokenizer = tokenizer or chunking_tokenizer()
+
+    if parallel is None:
+        parallel = len(documents) >= PARALLEL_THRESHOLD and (os.cpu_count() or 1) > 1
+    if parallel and len(documents) > 1:
+        pool = _get_pool()
+        # A few slices per worker keeps the workers busy when document sizes vary
+        slice_size = max(1, -(-len(content) // (_pool_workers * 4)))
+        slices = [content[i:i + slice_size] for i in range(0, len(content), slice_size)]
+        split = partial(split_texts, model_name=model_name, chunk_size=chunk_size, chunk_overlap=chunk_overlap, tokenizer=tokenizer)
+        splits = [chunks for result in pool.map(split, slices) for chunks in result]
+    else:
+        splits = split_texts(content, model_name, chunk_size, chunk_overlap, tokenizer)
+
+    chunks = []
+    for doc, texts in zip(documents, splits):
+        for position, text in enumerate(texts):
+            chunk = Document(page_content=text, metadata=copy.deepcopy(doc.metadata))
+            chunk.metadata['uuid'] = chunk_id(doc.metadata.get('project_name', ''), doc.metadata.get('url', ''), position, text)
+            chunks.append(chunk)
+
+    return chunks
@@ -0,0 +1,441 @@
+import re
+import math
+import time
+import queue
+import random
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional, Callable, Iterator, Tuple
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.dialects.postgresql import insert
+from searchflow import logger
+from searchflow.db.cache import TTLCache
+from searchflow.db.tables import Tables
+
+
+def embedding_key(text: str) -> str:
+    """
+    Return the content hash used to address a cached embedding.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query before it is used as a cache key, so whitespace variations hit the same entry.
+    """
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding provider with a content-addressed cache, so only texts that were
+    never embedded before with the same model are sent to the provider.
+
+    Document lookups go through an optional in-process LRU first, then the embedding_cache table.
+    Query embeddings are kept in a separate bounded TTL cache, keyed by the normalized query text.
+
+    Args:
+        embeddings (Embeddings): The embedding provider to wrap.
+        model (str): The model name, part of the cache key.
+        session_factory (Callable): SQLAlchemy session factory used for the persistent cache.
+        lru_size (int): The number of vectors to keep in memory, 0 disables the in-process LRU.
+        query_cache_size (int): The number of query vectors to keep in memory, 0 disables the query cache.
+        query_cache_ttl (float): The number of seconds a query vector stays cached.
+    """
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            model: str,
+            session_factory: Callable,
+            lru_size: int = 10000,
+            query_cache_size: int = 1024,
+            query_cache_ttl: Optional[float] = 3600
+            ):
+        self.embeddings = embeddings
+        self.model = model
+        self.Session = session_factory
+        self.lru = TTLCache(maxsize=lru_size)
+        self.query_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.logger = logger.setup_logger(name="CachedEmbeddings", level="WARNING")
+        self.db_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _load(self, keys: List[str]) -> Dict[str, List[float]]:
+        session = self.Session()
+        try:
+            rows = session.query(Tables.EmbeddingCache.content_hash, Tables.EmbeddingCache.embedding).filter(
+                Tables.EmbeddingCache.model == self.model,
+                Tables.EmbeddingCache.content_hash.in_(keys)
+            ).all()
+            return {row.content_hash: list(row.embedding) for row in rows}
+        except Exception as e:
+            self.logger.warning(f"Unable to read the embedding cache: {e}")
+            return {}
+        finally:
+            session.close()
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        session = self.Session()
+        try:
+            stmt = insert(Tables.EmbeddingCache).values(
+                [{"content_hash": key, "model": self.model, "embedding": vector} for key, vector in vectors.items()]
+            ).on_conflict_do_nothing(index_elements=["content_hash", "model"])
+            session.execute(stmt)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.logger.warning(f"Unable to write the embedding cache: {e}")
+        finally:
+            session.close()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        lru_misses = []
+        for key in dict.fromkeys(keys):
+            vector = self.lru.get(key)
+            if vector is None:
+                lru_misses.append(key)
+            else:
+                found[key] = vector
+
+        if lru_misses:
+            stored = self._load(lru_misses)
+            for key, vector in stored.items():
+                self.lru.set(key, vector)
+            found.update(stored)
+
+        to_embed = {key: text for key, text in zip(keys, texts) if key not in found}
+        if to_embed:
+            vectors = dict(zip(to_embed.keys(), self.embeddings.embed_documents(list(to_embed.values()))))
+            self._store(vectors)
+            for key, vector in vectors.items():
+                self.lru.set(key, vector)
+            found.update(vectors)
+
+        with self._lock:
+            self.db_hits += len(lru_misses) - len(to_embed)
+            self.misses += len(to_embed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model, normalize_query(text))
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key[1])
+            self.query_cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = (self.model, normalize_query(text))
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(key[1])
+            self.query_cache.set(key, vector)
+        return vector
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters. Every hit is a text that was not sent to the embedding provider.
+        """
+        hits = self.lru.hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "model": self.model,
+            "lru_hits": self.lru.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "query_hits": self.query_cache.hits,
+            "query_misses": self.query_cache.misses,
+        }
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that spaces out provider calls to a sustained rate.
+
+    Args:
+        rate_per_minute (float): The number of tokens added per minute, 0 disables the limit.
+        burst (int, optional): The maximum number of tokens that can be taken at once, defaults to one second of rate.
+    """
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst or max(1, int(self.rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    Return whether a provider error is a rate limit (HTTP 429) response.
+    """
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429 or type(error).__name__ == "TooManyRequestsError"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Return the wait in seconds asked for by the Retry-After header of a rate limit error, given as seconds or
+    as an HTTP date. None when the header is missing or cannot be parsed.
+    """
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+        return max(0.0, seconds) if math.isfinite(seconds) else None
+    except (TypeError, ValueError):
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Wraps an embedding provider so every provider call takes a token from a shared bucket,
+    and calls rejected with a rate limit error are retried with exponential backoff.
+
+    Args:
+        embeddings (Embeddings): The embedding provider to wrap.
+        requests_per_minute (float): The sustained number of provider calls per minute, 0 disables the limit.
+        max_retries (int): The number of retries of a rate limited call.
+        backoff (float): The wait before the first retry in seconds, doubled on every retry.
+    """
+    def __init__(self, embeddings: Embeddings, requests_per_minute: float = 2000, max_retries: int = 5, backoff: float = 1.0):
+        self.embeddings = embeddings
+        self.bucket = TokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.logger = logger.setup_logger(name="RateLimitedEmbeddings", level="WARNING")
+
+    def _call(self, function: Callable, *args):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return function(*args)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                wait = retry_after(e)
+                if wait is None:
+                    wait = self.backoff * 2 ** attempt * (1 + random.random())
+                self.logger.warning(f"Embedding provider rate limit reached, retrying in {wait:.1f}s")
+                time.sleep(wait)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call(self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call(self.embeddings.embed_query, text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+class EmbeddingExecutor:
+    """
+    Embeds a large list of texts as provider-sized batches sent concurrently, and yields every batch as soon
+    as it is embedded, so the caller can store it while the other batches are in flight.
+
+    Args:
+        embeddings (Embeddings): The embeddings to call, usually a CachedEmbeddings over a RateLimitedEmbeddings.
+        batch_size (int): The number of texts per provider call, 96 is the maximum of the Cohere embed endpoint.
+        max_workers (int): The number of concurrent provider calls.
+    """
+    def __init__(self, embeddings: Embeddings, batch_size: int = 96, max_workers: int = 4):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def map(self, texts: List[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """
+        Yield (offset, vectors) for every batch in completion order, vectors[i] is the embedding of texts[offset + i].
+        """
+        offsets = range(0, len(texts), self.batch_size)
+        if len(offsets) <= 1 or self.max_workers <= 1:
+            for offset in offsets:
+                yield offset, self.embeddings.embed_documents(texts[offset:offset + self.batch_size])
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed")
+        try:
+            futures = {
+                executor.submit(self.embeddings.embed_documents, texts[offset:offset + self.batch_size]): offset
+                for offset in offsets
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Collects the document embedding requests of concurrent callers for up to max_wait_ms milliseconds,
+    or until max_batch_size texts are waiting, and sends them to the provider as one call.
+    Every caller gets back the vectors of its own texts.
+
+    Requests of max_batch_size texts or more go to the provider directly. Query embeddings are never
+    combined, since providers embed queries and documents differently.
+
+    Args:
+        embeddings (Embeddings): The embedding provider to wrap.
+        max_batch_size (int): The maximum number of texts per provider call.
+        max_wait_ms (float): How long the first request of a batch waits for others to join.
+        max_workers (int): The number of provider calls that can be in flight at once.
+    """
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 96, max_wait_ms: float = 10, max_workers: int = 4):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_workers = max_workers
+        self.requests = 0
+        self.batches = 0
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed-batch")
+                self._dispatcher = threading.Thread(target=self._dispatch, name="embed-dispatcher", daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch(self) -> None:
+        pending = None
+        while True:
+            request = pending or self._queue.get()
+            pending = None
+            batch = [request]
+            size = len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if size + len(request[0]) > self.max_batch_size:
+                    # Does not fit, it starts the next batch
+                    pending = request
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch: List[Tuple[List[str], Future]]) -> None:
+        with self._lock:
+            self.requests += len(batch)
+            self.batches += 1
+        try:
+            vectors = self.embeddings.embed_documents([text for texts, _ in batch for text in texts])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for texts, future in batch:
+            future.set_result(vectors[offset:offset + len(texts)])
+            offset += len(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if len(texts) >= self.max_batch_size:
+            return self.embeddings.embed_documents(texts)
+        self._start()
+        future: Future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local embeddings using the hashing trick: every word and word bigram is hashed to one of `dimensions`
+    buckets with a hashed sign, and the counts are L2-normalized. Needs no network or model download, is
+    deterministic across processes, and texts sharing terms get a positive cosine similarity, so ingestion,
+    vector search and the graph can be run and load-tested offline.
+
+    Args:
+        dimensions (int): The size of the vectors, must match the vector column (EMBEDDING_DIMENSIONS).
+        latency_ms (float): A delay added to every call, to simulate a remote provider.
+    """
+    _token_pattern = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimensions: int = 1024, latency_ms: float = 0):
+        self.dimensions = dimensions
+        self.latency = latency_ms / 1000
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        return digest % self.dimensions, 1.0 if (digest >> 63) & 1 else -1.0
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = self._token_pattern.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = [0.0] * self.dimensions
+        # Empty texts get a fixed unit vector, a zero vector has no cosine distance
+        for feature in features or [""]:
+            index, sign = self._bucket(feature)
+            vector[index] += sign
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm == 0:
+            index, _ = self._bucket("")
+            vector[index] = norm = 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
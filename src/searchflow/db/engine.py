@@ -0,0 +1,86 @@
+import os
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+
+
+_lock = threading.Lock()
+_engines: Dict[Tuple[str, bool, Optional[int]], Engine] = {}
+# asyncpg connections are bound to the event loop that opened them, so async engines are kept per loop.
+_async_engines: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncEngine]]" = weakref.WeakKeyDictionary()
+
+
+def _pool_options(prefix: str = "DB") -> dict:
+    """
+    Read the connection pool settings from the environment.
+
+    Args:
+        prefix (str): The environment variable prefix, "DB" for the sync engine and "DB_ASYNC" for the async engine.
+            Async settings fall back to the sync ones when they are not set.
+
+    Returns:
+        dict: Keyword arguments for create_engine / create_async_engine.
+    """
+    def setting(name: str, default: int) -> int:
+        return int(os.getenv(f"{prefix}_{name}", os.getenv(f"DB_{name}", default)))
+
+    return {
+        "pool_size": setting("POOL_SIZE", 5),
+        "max_overflow": setting("MAX_OVERFLOW", 10),
+        "pool_timeout": setting("POOL_TIMEOUT", 30),
+        "pool_recycle": setting("POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+    }
+
+
+def get_engine(db_url: str, read_only: bool = False, statement_timeout: Optional[int] = None) -> Engine:
+    """
+    Return the process-wide sync engine for a database URL, creating it on first use.
+
+    Pool sizes are read from DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE.
+
+    Args:
+        db_url (str): The database URL.
+        read_only (bool): Open every transaction read-only.
+        statement_timeout (int, optional): Cancel statements that run longer than this many milliseconds.
+    """
+    key = (db_url, read_only, statement_timeout)
+    engine = _engines.get(key)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(key)
+            if engine is None:
+                options = []
+                if read_only:
+                    options.append("-c default_transaction_read_only=on")
+                if statement_timeout:
+                    options.append(f"-c statement_timeout={int(statement_timeout)}")
+                connect_args = {"options": " ".join(options)} if options else {}
+                engine = create_engine(db_url, connect_args=connect_args, **_pool_options())
+                _engines[key] = engine
+    return engine
+
+
+def get_async_engine(db_url: str) -> AsyncEngine:
+    """
+    Return the shared async engine for a database URL on the running event loop.
+
+    A long-running server has a single loop and therefore a single async pool. Pool sizes are read
+    from DB_ASYNC_POOL_SIZE and DB_ASYNC_MAX_OVERFLOW (falling back to the DB_* settings).
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = asyncio.get_event_loop()
+
+    with _lock:
+        engines = _async_engines.setdefault(loop, {})
+        engine = engines.get(db_url)
+        if engine is None:
+            engine = create_async_engine(db_url, **_pool_options("DB_ASYNC"))
+            engines[db_url] = engine
+    return engine
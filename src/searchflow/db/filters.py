@@ -0,0 +1,67 @@
+import json
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+from pydantic import BaseModel
+
+
+class SearchFilter(BaseModel):
+    """
+    Metadata filter for the vector and hybrid search, compiled into the WHERE clause of the search query.
+
+    List fields match any of the given values. Metadata fields are matched with JSONB containment on the
+    chunk metadata, so they are served by the GIN index on cmetadata. The date fields are matched against
+    the document the chunk belongs to.
+    """
+    file_type: Optional[List[str]] = None
+    language: Optional[List[str]] = None
+    source: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+    def compile(self, alias: str = "e") -> Tuple[str, dict]:
+        """
+        Compile the filter into SQL conditions on langchain_pg_embedding.
+
+        Args:
+            alias (str): The alias of langchain_pg_embedding in the query.
+
+        Returns:
+            Tuple[str, dict]: The conditions, each prefixed with AND (empty when nothing is filtered),
+                and their bind parameters.
+        """
+        conditions = []
+        params = {}
+
+        for field in ("file_type", "language", "source", "tags"):
+            values = getattr(self, field)
+            if not values:
+                continue
+            options = []
+            for i, value in enumerate(values):
+                name = f"f_{field}_{i}"
+                # Tags are stored as a list, the other fields as a single value
+                params[name] = json.dumps({field: [value] if field == "tags" else value})
+                options.append(f"{alias}.cmetadata @> CAST(:{name} AS jsonb)")
+            conditions.append("(" + " OR ".join(options) + ")")
+
+        date_conditions = []
+        for field, column, operator in (
+            ("created_after", "creation_date", ">="),
+            ("created_before", "creation_date", "<"),
+            ("uploaded_after", "upload_date", ">="),
+            ("uploaded_before", "upload_date", "<"),
+        ):
+            value = getattr(self, field)
+            if value is not None:
+                params[f"f_{field}"] = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+                date_conditions.append(f"d.{column} {operator} :f_{field}")
+        if date_conditions:
+            conditions.append(
+                f"EXISTS (SELECT 1 FROM document_metadata AS d WHERE d.id = {alias}.document_id AND "
+                + " AND ".join(date_conditions) + ")"
+            )
+
+        return "".join(f" AND {condition}" for condition in conditions), params
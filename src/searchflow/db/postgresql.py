@@ -1,46 +1,130 @@
 import os
 import uuid
+import hashlib
+import threading
+import weakref
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
-from typing import List, Annotated
+from typing import List, Annotated, Dict, Optional, Iterable, Iterator, Set, Tuple, BinaryIO, Callable
 from searchflow import logger
-from sqlalchemy import create_engine, text, func
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import text, func
 from sqlalchemy.dialects.postgresql import JSON
+import psycopg2
+from psycopg2.extras import execute_values, Json
 from sqlalchemy.orm import sessionmaker, declarative_base
-from supabase import create_client, Client
 from langchain_core.documents import Document
 from langchain_cohere import CohereEmbeddings
 from langchain_postgres.vectorstores import PGVector
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from searchflow.db.tables import Tables
+from searchflow.db.tables import Tables, VECTORSTORE_SCHEMA_UPGRADES, CONCURRENT_INDEXES, run_schema_upgrades
+from searchflow.db.engine import get_engine, get_async_engine
+from searchflow.db.embeddings import CachedEmbeddings, RateLimitedEmbeddings, MicroBatchingEmbeddings, EmbeddingExecutor, HashingEmbeddings
+from searchflow.db.chunking import chunk_content
+from searchflow.db.cache import TTLCache, InvalidationListener
+from searchflow.db.storage import get_object_store
+from searchflow.db import vector_search
+from searchflow.db.filters import SearchFilter
 import pytz
 
 
-def chunk_content(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 0) -> List[Document]:
+# PGVector handles per engine and project, shared by every DB instance in the process
+_vectorstores: "weakref.WeakKeyDictionary[object, Dict[str, PGVector]]" = weakref.WeakKeyDictionary()
+_vectorstores_lock = threading.Lock()
+# Collection uuid per project name. Entries expire after COLLECTION_CACHE_TTL seconds, and with DB_CACHE_NOTIFY
+# creating or removing a project clears the cache of every process, so a re-created project is never searched
+# under the uuid of its old collection
+_collection_ids = TTLCache(maxsize=1024, ttl=float(os.getenv('COLLECTION_CACHE_TTL', 60)))
+
+# Prompts and API keys, shared by every DB in the process. Writes clear the cache, and with DB_CACHE_NOTIFY
+# they also send a notification on CONFIG_CHANNEL that clears the caches of the other processes.
+_config_cache = TTLCache(maxsize=1024, ttl=float(os.getenv('CONFIG_CACHE_TTL', 60)))
+CONFIG_CHANNEL = "searchflow_config"
+
+
+def _clear_shared_caches() -> None:
+    '''
+    Clear the caches that other processes invalidate through CONFIG_CHANNEL
+    '''
+    _config_cache.clear()
+    _collection_ids.clear()
+_config_listener: Optional[InvalidationListener] = None
+_config_listener_lock = threading.Lock()
+
+# Database URLs whose schema was migrated by this process, and the shared DB returned by get_db
+_migrated: Set[str] = set()
+# Database URLs whose concurrent index builds were started by this process
+_index_builds: Set[str] = set()
+# Whether the full-text index of a database is valid, hybrid search is vector-only until it is
+_fulltext_index_ready = TTLCache(maxsize=16, ttl=float(os.getenv('FULLTEXT_INDEX_CHECK_TTL', 60)))
+_migrate_lock = threading.Lock()
+_db: Optional["DB"] = None
+_db_lock = threading.Lock()
+
+# Columns of the cached prompts, get_all_prompts caches their values and returns new Prompt objects on every call
+PROMPT_COLUMNS = ('id', 'name', 'prompt', 'creation_date', 'update_date')
+
+# Columns of document_metadata that are filled from the document metadata on ingest
+DOCUMENT_COLUMNS = (
+    'title', 'author', 'file_type', 'word_count', 'language', 'source', 'content_type', 'tags', 'summary',
+    'url', 'project_name', 'indexing_status', 'priority', 'read_time', 'creation_date', 'last_modified_date',
+    'upload_date', 'filename', 'content_hash'
+)
+
+
+# Project teardowns run one at a time in the background, so they never compete for the same rows
+_teardown_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="project-teardown")
+
+# Content types of the formats the upload page accepts, other extensions fall back to mimetypes
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "txt": "text/plain",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+def mime_type(filename: str) -> str:
     """
-    Chunk the content of the pages into smaller chunks. Will also add UUIDs to the chunks.
+    Return the content type of a file based on its extension.
+    """
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return MIME_TYPES.get(extension) or mimetypes.guess_type(filename)[0] or "text/html"
 
-    Args:
-        chunk_size (int): The maximum size of each chunk in characters. Defaults to 1000.
 
-    Returns:
-        list: A list of chunks containing the content of the pages.
+def batched(items: Iterable, batch_size: int) -> Iterator[list]:
     """
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    model_name="gpt-4",
-    chunk_size=chunk_size,
-    chunk_overlap=chunk_overlap,
-    )
-    
-    metadatas = [doc.metadata for doc in documents]
-    content = [' '.join(doc.page_content.split()) for doc in documents]
+    Split an iterable into lists of at most batch_size items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    chunks = text_splitter.create_documents(content, metadatas=metadatas)
 
-    for chunk in chunks:
-        chunk.metadata['uuid'] = str(uuid.uuid4())
-        
-    return chunks
+def hash_content(content: str | bytes) -> str:
+    """
+    Return the sha256 hash of a document's content, used to detect unchanged documents on re-import.
+    Text is whitespace-normalized the same way chunk_content does, so formatting-only changes are ignored.
+    """
+    if isinstance(content, str):
+        content = ' '.join(content.split()).encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_db() -> "DB":
+    """
+    Return the DB shared by the whole process, created on first use.
+    """
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = DB()
+    return _db
 
 
 class DB:
@@ -60,25 +144,257 @@ class DB:
         remove_prompt: Remove a prompt from the database
         get_all_prompts: Retrieve all prompts from the database
     """
-    def __init__(self):
+    def __init__(self, migrate: Optional[bool] = None):
+        '''
+        Set up the connection pools. Clients of external services are created on first use.
+
+        args:
+            migrate (bool, optional): Run the schema migrations, once per process. Defaults to DB_AUTO_MIGRATE (true),
+                deployments that migrate separately (see DB.migrate) can turn it off.
+        '''
         self.logger = logger.setup_logger(name="DB", level="WARNING")
-        self.embeddings = CohereEmbeddings(model="embed-multilingual-v3.0")
+        self.embedding_model = os.getenv('EMBEDDING_MODEL', "embed-multilingual-v3.0")
         self.db_name = os.getenv('DB_NAME')
         self.db_user = os.getenv('DB_USER')
         self.db_password = os.getenv('DB_PASSWORD')
         self.db_host = os.getenv('DB_HOST')
         self.db_port = os.getenv('DB_PORT')
         self.db_url = f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
+        self.async_db_url = f"postgresql+asyncpg://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
         try:
-            self.engine = create_engine(self.db_url)
+            self.engine = get_engine(self.db_url)
         except:
             self.logger.error('Unable to connect to database, please check the connection string: %s', self.db_url)
         self.Session = sessionmaker(bind=self.engine)
         self.tables = Tables(self.engine)
-        self.supabase: Client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
-        
-        vectorstore = PGVector(self.embeddings, connection=self.engine)
-        vectorstore.create_tables_if_not_exists()
+        self._embeddings: Optional[CachedEmbeddings] = None
+        self._embeddings_lock = threading.Lock()
+        self.bulk_batch_size = int(os.getenv('DB_BULK_BATCH_SIZE', 1000))
+        self.teardown_batch_size = int(os.getenv('DB_TEARDOWN_BATCH_SIZE', 5000))
+        # Ad-hoc queries (run_query, stream_query, the SQL agent) run read-only, on a replica when DB_READONLY_URL is set
+        self.query_timeout = int(os.getenv('QUERY_STATEMENT_TIMEOUT', 30000))
+        self.query_max_rows = int(os.getenv('QUERY_MAX_ROWS', 1000))
+        self.query_batch_size = int(os.getenv('QUERY_BATCH_SIZE', 500))
+        self.readonly_engine = get_engine(
+            os.getenv('DB_READONLY_URL', self.db_url), read_only=True, statement_timeout=self.query_timeout
+        )
+        self.cache_notify = os.getenv('DB_CACHE_NOTIFY', 'false').lower() in ('1', 'true', 'yes')
+        if self.cache_notify:
+            self._start_config_listener()
+        self.embedding_dimensions = int(os.getenv('EMBEDDING_DIMENSIONS', 1024))
+        # "cohere" (default) or "hashing", a local provider for offline runs and load tests
+        self.embedding_provider = os.getenv('EMBEDDING_PROVIDER', 'cohere').lower()
+        if self.embedding_provider not in ('cohere', 'hashing'):
+            raise ValueError(f"Invalid embedding provider: {self.embedding_provider}. Valid providers are ['cohere', 'hashing']")
+        self.ef_search = int(os.getenv('VECTOR_EF_SEARCH', 0)) or None
+        # Terms found in a larger share of all chunks are left out of the full-text side of hybrid search
+        self.max_term_frequency = float(os.getenv('HYBRID_MAX_TERM_FREQUENCY', 0.2))
+        self.probes = int(os.getenv('VECTOR_PROBES', 0)) or None
+        self.storage = get_object_store()
+        # Signed URLs are reused until SIGNED_URL_REFRESH seconds before they expire
+        self.signed_url_expiry = int(os.getenv('SIGNED_URL_EXPIRY', 3600))
+        self.signed_urls = TTLCache(
+            maxsize=int(os.getenv('SIGNED_URL_CACHE_SIZE', 10000)),
+            ttl=max(self.signed_url_expiry - int(os.getenv('SIGNED_URL_REFRESH', 300)), 0),
+        )
+
+        if migrate is None:
+            migrate = os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')
+        if migrate:
+            self.migrate()
+            if os.getenv('DB_BUILD_INDEXES', 'true').lower() in ('1', 'true', 'yes'):
+                self.start_index_build()
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        '''
+        The cached embedding provider, the provider client is created on first use.
+        Provider calls are limited to EMBEDDING_RPM per minute, rate limited calls are retried with backoff.
+        Concurrent requests of fewer than EMBEDDING_BATCH_SIZE texts are combined into one provider call.
+        With EMBEDDING_PROVIDER=hashing the vectors are computed locally, without rate limit, after
+        EMBEDDING_LATENCY_MS milliseconds per call.
+        '''
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    if self.embedding_provider == 'hashing':
+                        provider = HashingEmbeddings(
+                            dimensions=self.embedding_dimensions,
+                            latency_ms=float(os.getenv('EMBEDDING_LATENCY_MS', 0)),
+                        )
+                        # Hashed vectors must never be served from the cache of a real model
+                        model = f"hashing-{self.embedding_dimensions}"
+                    else:
+                        provider = RateLimitedEmbeddings(
+                            CohereEmbeddings(model=self.embedding_model),
+                            requests_per_minute=float(os.getenv('EMBEDDING_RPM', 2000)),
+                            max_retries=int(os.getenv('EMBEDDING_MAX_RETRIES', 5)),
+                        )
+                        model = self.embedding_model
+                    # Small embedding requests of concurrent ingest jobs share provider calls
+                    provider = MicroBatchingEmbeddings(
+                        provider,
+                        max_batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 96)),
+                        max_wait_ms=float(os.getenv('EMBEDDING_MICROBATCH_WAIT_MS', 10)),
+                        max_workers=int(os.getenv('EMBEDDING_CONCURRENCY', 4)),
+                    )
+                    self._embeddings = CachedEmbeddings(
+                        provider,
+                        model=model,
+                        session_factory=self.Session,
+                        lru_size=int(os.getenv('EMBEDDING_CACHE_SIZE', 10000)),
+                        query_cache_size=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 1024)),
+                        query_cache_ttl=float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', 3600)),
+                    )
+        return self._embeddings
+
+    def migrate(self, force: bool = False, concurrent_indexes: bool = False) -> None:
+        '''
+        Create the missing tables (including the PGVector tables) and apply the schema upgrades.
+        Runs once per database per process unless force is set.
+
+        args:
+            force (bool): Migrate again, even if this process already did
+            concurrent_indexes (bool): Also build the indexes that are built concurrently, which can take minutes
+                on large tables (see create_concurrent_indexes). The automatic migration on startup builds them in a
+                background thread instead (see start_index_build).
+        '''
+        with _migrate_lock:
+            if self.db_url not in _migrated or force:
+                self.tables.migrate()
+                # The embeddings are not used to create the tables, so the provider client is not created here
+                vectorstore = PGVector(None, connection=self.engine)
+                vectorstore.create_tables_if_not_exists()
+                run_schema_upgrades(self.engine, VECTORSTORE_SCHEMA_UPGRADES)
+                _migrated.add(self.db_url)
+        if concurrent_indexes:
+            self.create_concurrent_indexes()
+
+    def start_index_build(self) -> None:
+        '''
+        Build the concurrently built indexes in a daemon thread, once per database per process.
+        Writes go on while they are built, and hybrid search is vector-only until the full-text index is valid.
+        Turned off with DB_BUILD_INDEXES=false, for deployments that build them with migrate(concurrent_indexes=True).
+        '''
+        with _migrate_lock:
+            if self.db_url in _index_builds:
+                return
+            _index_builds.add(self.db_url)
+        threading.Thread(target=self.create_concurrent_indexes, name="build-indexes", daemon=True).start()
+
+    def create_concurrent_indexes(self) -> bool:
+        '''
+        Build the indexes of CONCURRENT_INDEXES and the full-text index used by hybrid search, without blocking
+        writes, and collect the statistics of the full-text index. Hybrid search falls back to vector search until
+        the full-text index is valid. An invalid index left by an interrupted build is dropped and built again.
+        Builds already running in another process are left alone.
+
+        returns:
+            bool: True if all the indexes exist, False otherwise
+        '''
+        statements = {name: f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}" for name, definition in CONCURRENT_INDEXES.items()}
+        statements[vector_search.FULLTEXT_INDEX_NAME] = vector_search.create_fulltext_index_sql()
+        try:
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                # A build in progress looks like an invalid index, so only the lock holder may drop one
+                lock = {"key": "searchflow_concurrent_indexes"}
+                if not conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), lock).scalar():
+                    self.logger.info("The indexes are being built by another process")
+                    return False
+                try:
+                    for name, statement in statements.items():
+                        valid = conn.execute(vector_search.index_valid_query(), {"name": name}).scalar()
+                        if valid:
+                            continue
+                        if valid is False:
+                            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                        conn.execute(text(statement))
+                        self.logger.info(f"Created index {name}")
+                        if name == vector_search.FULLTEXT_INDEX_NAME:
+                            # Hybrid search leaves out the most common terms, which are read from the index statistics
+                            conn.execute(text("ANALYZE langchain_pg_embedding"))
+                finally:
+                    conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), lock)
+            _fulltext_index_ready.set(self.db_url, True)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error creating the indexes: {e}")
+            return False
+
+    async def _afulltext_index_ready(self) -> bool:
+        '''
+        Return whether the full-text index is valid, checked at most once per FULLTEXT_INDEX_CHECK_TTL seconds
+        '''
+        ready = _fulltext_index_ready.get(self.db_url)
+        if ready is None:
+            async with get_async_engine(self.async_db_url).connect() as conn:
+                ready = bool((await conn.execute(
+                    vector_search.index_valid_query(), {"name": vector_search.FULLTEXT_INDEX_NAME}
+                )).scalar())
+            _fulltext_index_ready.set(self.db_url, ready)
+            if not ready:
+                self.logger.warning("The full-text index is not built yet, hybrid search falls back to vector search")
+        return ready
+
+    def _get_vectorstore(self, project_name: str) -> PGVector:
+        '''
+        Return the cached sync PGVector handle for a project, creating it on first use.
+        '''
+        with _vectorstores_lock:
+            stores = _vectorstores.setdefault(self.engine, {})
+            vectorstore = stores.get(project_name)
+        if vectorstore is None:
+            vectorstore = PGVector(
+                embeddings=self.embeddings,
+                collection_name=project_name,
+                connection=self.engine,
+                use_jsonb=True,
+                create_extension=False,
+            )
+            with _vectorstores_lock:
+                vectorstore = stores.setdefault(project_name, vectorstore)
+        return vectorstore
+
+    @staticmethod
+    def _invalidate_vectorstore(project_name: str) -> None:
+        '''
+        Drop the cached PGVector handles of a project, for every engine in the process.
+        '''
+        with _vectorstores_lock:
+            for stores in _vectorstores.values():
+                stores.pop(project_name, None)
+            _collection_ids.pop(project_name, None)
+
+    def _collection_id(self, project_name: str) -> str:
+        '''
+        Return the uuid of the PGVector collection of a project
+        '''
+        collection_id = _collection_ids.get(project_name)
+        if collection_id is None:
+            with self.engine.connect() as conn:
+                collection_id = conn.execute(
+                    text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"), {"name": project_name}
+                ).scalar()
+            if collection_id is None:
+                raise ValueError(f"No collection found for project: {project_name}")
+            collection_id = str(collection_id)
+            _collection_ids.set(project_name, collection_id)
+        return collection_id
+
+    async def _acollection_id(self, conn, project_name: str) -> str:
+        '''
+        Return the uuid of the PGVector collection of a project, using an async connection
+        '''
+        collection_id = _collection_ids.get(project_name)
+        if collection_id is None:
+            collection_id = (await conn.execute(
+                text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"), {"name": project_name}
+            )).scalar()
+            if collection_id is None:
+                raise ValueError(f"No collection found for project: {project_name}")
+            collection_id = str(collection_id)
+            _collection_ids.set(project_name, collection_id)
+        return collection_id
 
 
     def list_projects(self):
@@ -95,26 +411,126 @@ class DB:
             session.close()
 
 
-    async def asimilarity_search(self, question: str, project_name: str):
+    @staticmethod
+    def _compile_filter(search_filter: Optional[SearchFilter | dict]) -> tuple:
+        '''
+        Compile a search filter into SQL conditions and bind parameters
+        '''
+        if not search_filter:
+            return "", {}
+        if isinstance(search_filter, dict):
+            search_filter = SearchFilter(**search_filter)
+        return search_filter.compile()
 
-        db_url = f"postgresql+asyncpg://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
-        async_engine = create_async_engine(db_url)
+    async def aembed_query(self, question: str) -> List[float]:
+        '''
+        Embed a question, served from the query-embedding cache when it was asked before
+        '''
+        return await self.embeddings.aembed_query(question)
+
+    async def asimilarity_search(
+            self,
+            question: str,
+            project_name: str,
+            embedding: Optional[List[float]] = None,
+            k: int = 3,
+            ef_search: Optional[int] = None,
+            probes: Optional[int] = None,
+            search_filter: Optional[SearchFilter | dict] = None
+            ):
+        '''
+        Search a project for the chunks most similar to a question
 
-        async_vectorstore = PGVector(
-            embeddings=self.embeddings,
-            collection_name=project_name,
-            connection=async_engine,
-            use_jsonb=True,
-            create_extension=False,
-            async_mode=True,
-        )
+        args:
+            question (str): The question to search for
+            project_name (str): The name of the project
+            embedding (List[float], optional): A precomputed vector for the question, skips embedding the question
+            k (int): The number of results to return
+            ef_search (int, optional): HNSW candidate list size, defaults to VECTOR_EF_SEARCH
+            probes (int, optional): Number of IVFFlat lists to scan, defaults to VECTOR_PROBES
+            search_filter (SearchFilter | dict, optional): Metadata filter applied in the query
 
-        result = await async_vectorstore.asimilarity_search_with_relevance_scores(question, k=3)
+        returns:
+            List[Tuple[Document, float]]: The documents with their relevance scores
+        '''
+        if embedding is None:
+            embedding = await self.aembed_query(question)
+
+        async_engine = get_async_engine(self.async_db_url)
+        async with async_engine.begin() as conn:
+            collection_id = await self._acollection_id(conn, project_name)
+            for setting in vector_search.search_settings(ef_search or self.ef_search, probes or self.probes):
+                await conn.execute(text(setting))
+            conditions, params = self._compile_filter(search_filter)
+            result = await conn.execute(
+                vector_search.similarity_query(collection_id, self.embedding_dimensions, conditions),
+                {"embedding": vector_search.vector_literal(embedding), "k": k, **params}
+            )
+            return vector_search.rows_to_documents(result.all())
+    
+    async def ahybrid_search(
+            self,
+            question: str,
+            project_name: str,
+            embedding: Optional[List[float]] = None,
+            k: int = 3,
+            candidates: int = 20,
+            rrf_k: int = 60,
+            ef_search: Optional[int] = None,
+            probes: Optional[int] = None,
+            search_filter: Optional[SearchFilter | dict] = None,
+            max_term_frequency: Optional[float] = None
+            ):
+        '''
+        Search a project with both the vector index and the full-text index in one round trip,
+        fusing the two rankings with reciprocal rank fusion
 
-        # Add the score to the result metadata
+        args:
+            question (str): The question to search for
+            project_name (str): The name of the project
+            embedding (List[float], optional): A precomputed vector for the question, skips embedding the question
+            k (int): The number of results to return
+            candidates (int): The number of hits taken from each ranking before fusion
+            rrf_k (int): The rank constant of reciprocal rank fusion
+            ef_search (int, optional): HNSW candidate list size, defaults to VECTOR_EF_SEARCH
+            probes (int, optional): Number of IVFFlat lists to scan, defaults to VECTOR_PROBES
+            search_filter (SearchFilter | dict, optional): Metadata filter applied to both rankings
+            max_term_frequency (float, optional): Question terms found in a larger share of all chunks are not
+                searched for, defaults to HYBRID_MAX_TERM_FREQUENCY (0.2)
+
+        returns:
+            List[Tuple[Document, float]]: The documents with their relevance scores, ordered by fusion score.
+                The metadata holds rrf_score, vector_rank, lexical_rank and lexical_score
+                (the rank and score are None when a ranking missed the chunk).
+                Until the full-text index is built (see create_concurrent_indexes), the results of asimilarity_search.
+        '''
+        if not await self._afulltext_index_ready():
+            return await self.asimilarity_search(
+                question, project_name, embedding=embedding, k=k, ef_search=ef_search, probes=probes, search_filter=search_filter
+            )
+        if embedding is None:
+            embedding = await self.aembed_query(question)
+
+        async_engine = get_async_engine(self.async_db_url)
+        async with async_engine.begin() as conn:
+            collection_id = await self._acollection_id(conn, project_name)
+            for setting in vector_search.search_settings(ef_search or self.ef_search, probes or self.probes):
+                await conn.execute(text(setting))
+            conditions, params = self._compile_filter(search_filter)
+            result = await conn.execute(
+                vector_search.hybrid_query(collection_id, self.embedding_dimensions, conditions),
+                {
+                    "embedding": vector_search.vector_literal(embedding),
+                    "query": question,
+                    "max_term_frequency": self.max_term_frequency if max_term_frequency is None else max_term_frequency,
+                    "candidates": max(candidates, k),
+                    "rrf_k": rrf_k,
+                    "k": k,
+                    **params,
+                }
+            )
+            return vector_search.hybrid_rows_to_documents(result.all())
 
-        return result
-    
     def list_scraped_urls(self) -> List[str]:
         """
         List all vectorized documents in the database.
@@ -131,6 +547,33 @@ class DB:
         session.close()
         return unique_urls
     
+    def filter_indexed_urls(self, project_name: str, urls: List[str]) -> Set[str]:
+        '''
+        Return the URLs of a batch of candidates that are already indexed in a project
+
+        The lookup uses the unique (url, project_name) index of document_metadata and runs
+        in batches of DB_BULK_BATCH_SIZE URLs.
+
+        args:
+            project_name (str): The name of the project
+            urls (List[str]): The candidate URLs
+
+        returns:
+            Set[str]: The candidate URLs that are already indexed
+        '''
+        session = self.Session()
+        indexed = set()
+        try:
+            for batch in batched(dict.fromkeys(urls), self.bulk_batch_size):
+                rows = session.query(self.tables.Documents.url).filter(
+                    self.tables.Documents.project_name == project_name,
+                    self.tables.Documents.url.in_(batch)
+                ).all()
+                indexed.update(row.url for row in rows)
+            return indexed
+        finally:
+            session.close()
+
     def remove_by_url(self, project_name: str, url: str) -> None:
         '''
         Remove all documents that have the specified URL in their metadata
@@ -142,20 +585,54 @@ class DB:
         returns:
             None
         '''
-        query = text(f"""
+        self.remove_by_urls(project_name, [url])
+
+    def remove_by_urls(self, project_name: str, urls: List[str], include_metadata: bool = False, session=None) -> None:
+        '''
+        Remove the chunks of a set of URLs from a project, with one indexed DELETE per batch of DB_BULK_BATCH_SIZE URLs
+
+        args:
+            project_name (str): The name of the project
+            urls (List[str]): The URLs to remove
+            include_metadata (bool): Also remove the documents from document_metadata
+            session (Session, optional): Run the deletes in the transaction of this session, the caller commits
+
+        returns:
+            None
+        '''
+        if session is not None:
+            return self._remove_by_urls(session, project_name, urls, include_metadata)
+
+        session = self.Session()
+        try:
+            self._remove_by_urls(session, project_name, urls, include_metadata)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.logger.error(f"Error removing documents by URL: {e}")
+            raise
+        finally:
+            session.close()
+
+    def _remove_by_urls(self, session, project_name: str, urls: List[str], include_metadata: bool) -> None:
+        delete_chunks = text("""
             DELETE FROM langchain_pg_embedding
-            WHERE cmetadata->>'url' = '{url}'
-            AND collection_id = (
+            WHERE collection_id = (
                 SELECT uuid
                 FROM langchain_pg_collection
-                WHERE name = '{project_name}'
+                WHERE name = :project_name
             )
+            AND cmetadata->>'url' = ANY(:urls)
         """)
-        session = self.Session()
-        session.execute(query)
-        session.commit()
-        session.close()
-    
+        for batch in batched(dict.fromkeys(urls), self.bulk_batch_size):
+            if include_metadata:
+                # Linked chunks are removed by the foreign key, chunks ingested before it existed by the query below
+                session.query(self.tables.Documents).filter(
+                    self.tables.Documents.project_name == project_name,
+                    self.tables.Documents.url.in_(batch)
+                ).delete(synchronize_session=False)
+            session.execute(delete_chunks, {"urls": batch, "project_name": project_name})
+
     def get_collection_metdata(self, project_name: str):
         '''
         Get the metadata of a collection
@@ -179,57 +656,242 @@ class DB:
         session.close()
         return metadata
 
-    def add_documents(self, documents: List[Document], project_name: str):
+    def get_collection_statistics(self, project_name: str) -> dict:
         '''
-        Calculate Vectors for a set of documents and upload them to the database
+        Return the document counts of a project, aggregated in the database
+
+        args:
+            project_name (str): The name of the project
+
+        returns:
+            dict: The number of documents, distinct sources and formats, and the number of documents
+                per source and per file type
+        '''
+        Documents = self.tables.Documents
+        session = self.Session()
+        try:
+            totals = session.query(
+                func.count(Documents.id).label("documents"),
+                func.count(func.distinct(Documents.source)).label("sources"),
+                func.count(func.distinct(Documents.file_type)).label("formats"),
+            ).filter(Documents.project_name == project_name).one()
+
+            breakdowns = {}
+            for column in (Documents.source, Documents.file_type):
+                rows = session.query(column, func.count(Documents.id)).filter(
+                    Documents.project_name == project_name
+                ).group_by(column).order_by(func.count(Documents.id).desc()).all()
+                breakdowns[column.key] = {value: count for value, count in rows}
+
+            return {
+                "documents": totals.documents,
+                "sources": totals.sources,
+                "formats": totals.formats,
+                "by_source": breakdowns["source"],
+                "by_file_type": breakdowns["file_type"],
+            }
+        finally:
+            session.close()
+
+    def list_documents(self, project_name: str, limit: int = 100, after_id: Optional[int] = None) -> List[dict]:
         '''
+        List the documents of a project one page at a time, ordered by id
+
+        args:
+            project_name (str): The name of the project
+            limit (int): The maximum number of documents to return
+            after_id (int, optional): The id of the last document of the previous page
 
+        returns:
+            List[dict]: The id, title, source, file_type and url of every document on the page
+        '''
+        Documents = self.tables.Documents
         session = self.Session()
+        try:
+            query = session.query(
+                Documents.id, Documents.title, Documents.source, Documents.file_type, Documents.url
+            ).filter(Documents.project_name == project_name)
+            if after_id is not None:
+                query = query.filter(Documents.id > after_id)
+            return [row._asdict() for row in query.order_by(Documents.id).limit(limit).all()]
+        finally:
+            session.close()
 
-        # print the URLS of the documents th
-
-        try:
-            for doc in documents:
-                document_metadata = self.tables.Documents(
-                    title=doc.metadata['title'],
-                    author=doc.metadata['author'],
-                    file_type=doc.metadata['file_type'],
-                    word_count=doc.metadata['word_count'],
-                    language=doc.metadata['language'],
-                    source=doc.metadata['source'],
-                    content_type=doc.metadata['content_type'],
-                    tags=doc.metadata['tags'],
-                    summary=doc.metadata['summary'],
-                    url=doc.metadata['url'],
-                    project_name=doc.metadata['project_name'],
-                    indexing_status=doc.metadata['indexing_status'],
-                    priority=doc.metadata['priority'],
-                    read_time=doc.metadata['read_time'],
-                    creation_date=doc.metadata['creation_date'],
-                    last_modified_date=doc.metadata['last_modified_date'],
-                    upload_date=doc.metadata['upload_date'],
-                    filename=doc.metadata['filename']
-                )
-                session.add(document_metadata)
+    def _bulk_upsert(
+            self,
+            session,
+            table: str,
+            rows: List[dict],
+            constraint: str,
+            set_: Dict[str, str],
+            batch_size: int,
+            returning: Optional[str] = None
+            ) -> Optional[List[tuple]]:
+        '''
+        Write rows with multi-row INSERT ... ON CONFLICT ON CONSTRAINT ... DO UPDATE statements of batch_size rows.
 
-            vectorstore = PGVector(
-            embeddings=self.embeddings,
-            collection_name=project_name,
-            connection=self.engine,
-            use_jsonb=True,
+        args:
+            table (str): The table to write to
+            rows (List[dict]): The rows to write, all with the same keys
+            constraint (str): The unique constraint that detects existing rows
+            set_ (Dict[str, str]): The SQL expression for every column to update on conflict
+            returning (str, optional): The columns to return for every written row
+
+        returns:
+            List[tuple]: The returned columns of every row when returning is set, None otherwise
+        '''
+        if not rows:
+            return [] if returning else None
+        columns = list(rows[0].keys())
+        query = (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s "
+            f"ON CONFLICT ON CONSTRAINT {constraint} DO UPDATE SET "
+            + ", ".join(f"{column} = {expression}" for column, expression in set_.items())
+        )
+        if returning:
+            query += f" RETURNING {returning}"
+        cursor = session.connection().connection.cursor()
+        result = execute_values(
+            cursor, query, [tuple(row[column] for column in columns) for row in rows], page_size=batch_size, fetch=bool(returning)
         )
-            documents = chunk_content(documents)
+        return result if returning else None
 
-            ids = [doc.metadata["uuid"] for doc in documents]
-            # Remove the dates from the metadata
-            for doc in documents:
-                del doc.metadata['creation_date']
-                del doc.metadata['last_modified_date']
-                del doc.metadata['upload_date']
+    def _upsert_documents(self, session, documents: List[Document], batch_size: int) -> Dict[str, int]:
+        '''
+        Upsert the metadata of a set of documents into document_metadata.
+        A document that is already known for a project (same URL) is updated instead of failing the batch.
 
-            result = vectorstore.add_documents(documents, ids=ids)
+        returns:
+            Dict[str, int]: The document_metadata id of every document, by URL
+        '''
+        # Postgres rejects a statement that updates the same row twice, keep the last version of every URL
+        rows = {}
+        for doc in documents:
+            row = {column: doc.metadata.get(column) for column in DOCUMENT_COLUMNS}
+            rows[(row['url'], row['project_name'])] = row
+
+        written = self._bulk_upsert(
+            session,
+            table=self.tables.Documents.__tablename__,
+            rows=list(rows.values()),
+            constraint='uq_doc_url_project',
+            set_={column: f"EXCLUDED.{column}" for column in DOCUMENT_COLUMNS if column not in ('url', 'project_name')},
+            batch_size=batch_size,
+            returning="url, id"
+        )
+        return dict(written)
 
+    def _insert_chunks(self, session, collection_id: str, chunks: List[Document], vectors: List[List[float]], document_ids: Dict[str, int], batch_size: int) -> None:
+        '''
+        Upsert chunks into langchain_pg_embedding with their document_id set, so the rows are written once
+        instead of being inserted by PGVector and updated afterwards
+        '''
+        rows = [
+            {
+                "id": chunk.metadata["uuid"],
+                "collection_id": collection_id,
+                "embedding": vector_search.vector_literal(vector),
+                "document": chunk.page_content,
+                "cmetadata": Json(chunk.metadata),
+                "document_id": document_ids.get(chunk.metadata.get("url")),
+            }
+            for chunk, vector in zip(chunks, vectors)
+        ]
+        self._bulk_upsert(
+            session,
+            table="langchain_pg_embedding",
+            rows=rows,
+            constraint="langchain_pg_embedding_pkey",
+            set_={column: f"EXCLUDED.{column}" for column in ("collection_id", "embedding", "document", "cmetadata", "document_id")},
+            batch_size=batch_size
+        )
+
+    def get_document_hashes(self, project_name: str, urls: List[str]) -> Dict[str, str]:
+        '''
+        Return the stored content hash of every known document in a project, by URL
+
+        args:
+            project_name (str): The name of the project
+            urls (List[str]): The URLs to look up
+
+        returns:
+            Dict[str, str]: The content hash per URL, unknown URLs and documents without a hash are left out
+        '''
+        session = self.Session()
+        hashes = {}
+        try:
+            for batch in batched(dict.fromkeys(urls), self.bulk_batch_size):
+                rows = session.query(self.tables.Documents.url, self.tables.Documents.content_hash).filter(
+                    self.tables.Documents.project_name == project_name,
+                    self.tables.Documents.url.in_(batch),
+                    self.tables.Documents.content_hash.isnot(None)
+                ).all()
+                hashes.update({row.url: row.content_hash for row in rows})
+            return hashes
+        finally:
+            session.close()
+
+    def get_uploaded_file(self, project_name: str, filename: str) -> dict | None:
+        '''
+        Return the storage URL and content hash of an uploaded file, None if the file is unknown
+        '''
+        session = self.Session()
+        try:
+            file = session.query(self.tables.Documents).filter_by(project_name=project_name, filename=filename, source="uploaded_file").first()
+            if file:
+                return {"url": file.url, "content_hash": file.content_hash}
+            return None
+        finally:
+            session.close()
+
+    def add_documents(self, documents: List[Document], project_name: str, batch_size: Optional[int] = None):
+        '''
+        Calculate Vectors for a set of documents and upload them to the database
+
+        Documents whose content hash did not change since they were last ingested are skipped. For changed
+        documents the stale chunks are replaced. Chunks are upserted on their deterministic id, so a retried
+        ingest overwrites the rows it already wrote instead of duplicating them. The document metadata and the chunks are written with multi-row
+        upserts of batch_size rows (DB_BULK_BATCH_SIZE by default). The metadata is written first, so every chunk
+        is inserted with its document_id. The removal of the stale chunks, the metadata and the chunks are committed in
+        one transaction, so a failed ingest keeps the previous version of the documents and is retried as changed.
+        '''
+        batch_size = batch_size or self.bulk_batch_size
+
+        known_hashes = self.get_document_hashes(project_name, [doc.metadata['url'] for doc in documents])
+        documents = [doc for doc in documents if doc.metadata.get('content_hash') is None or known_hashes.get(doc.metadata['url']) != doc.metadata['content_hash']]
+        if not documents:
+            self.logger.info("All documents are unchanged, nothing to add")
+            return None
+
+        session = self.Session()
+
+        try:
+            # Creates the collection of a new project
+            self._get_vectorstore(project_name)
+            collection_id = self._collection_id(project_name)
+            # The stale chunks are deleted in the ingest transaction, a failed ingest keeps the old ones
+            self.remove_by_urls(project_name, [doc.metadata['url'] for doc in documents], session=session)
+            # Chunk ids are deterministic, duplicate input documents give the same chunks and are written once
+            chunks = list({chunk.metadata["uuid"]: chunk for chunk in chunk_content(documents)}.values())
+
+            # Remove the dates from the metadata
+            for chunk in chunks:
+                del chunk.metadata['creation_date']
+                del chunk.metadata['last_modified_date']
+                del chunk.metadata['upload_date']
+
+            # Provider-sized batches are embedded concurrently and stored as soon as they complete
+            executor = EmbeddingExecutor(
+                self.embeddings,
+                batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 96)),
+                max_workers=int(os.getenv('EMBEDDING_CONCURRENCY', 4)),
+            )
+            document_ids = self._upsert_documents(session, documents, batch_size)
+            texts = [chunk.page_content for chunk in chunks]
+            for offset, vectors in executor.map(texts):
+                self._insert_chunks(session, collection_id, chunks[offset:offset + len(vectors)], vectors, document_ids, batch_size)
             session.commit()
+            self.logger.info(f"Embedding cache: {self.embedding_cache_stats()}")
 
         except Exception as e:
             session.rollback()
@@ -238,24 +900,108 @@ class DB:
         finally:
             session.close()
 
-    
-    def similarity_search(self, project_name: str, query: str, top_k: int = 3):
+    def embedding_cache_stats(self) -> dict:
         '''
-        Search for similar documents in a project
+        Return the hit/miss counters of the embedding cache used during ingestion
         '''
-        vectorstore = PGVector(
-            embeddings=self.embeddings,
-            collection_name=project_name,
-            connection=self.engine,
-            use_jsonb=True,
-        )
+        return self.embeddings.stats()
+
+    def similarity_search(
+            self,
+            project_name: str,
+            query: str,
+            top_k: int = 3,
+            ef_search: Optional[int] = None,
+            probes: Optional[int] = None,
+            search_filter: Optional[SearchFilter | dict] = None
+            ):
+        '''
+        Search for similar documents in a project, optionally narrowed by a metadata filter
+        '''
+        embedding = self.embeddings.embed_query(query)
+        with self.engine.begin() as conn:
+            collection_id = self._collection_id(project_name)
+            for setting in vector_search.search_settings(ef_search or self.ef_search, probes or self.probes):
+                conn.execute(text(setting))
+            conditions, params = self._compile_filter(search_filter)
+            result = conn.execute(
+                vector_search.similarity_query(collection_id, self.embedding_dimensions, conditions),
+                {"embedding": vector_search.vector_literal(embedding), "k": top_k, **params}
+            )
+            return [doc for doc, _ in vector_search.rows_to_documents(result.all())]
 
-        result = vectorstore.similarity_search(query, top_k=top_k)
+    def create_vector_index(self, project_name: str, method: str = "hnsw", m: int = 16, ef_construction: int = 64, lists: Optional[int] = None) -> bool:
+        '''
+        Create a partial ANN index over the chunks of a project, without blocking writes
 
+        args:
+            project_name (str): The name of the project
+            method (str): "hnsw" or "ivfflat"
+            m (int): HNSW, the maximum number of connections per layer
+            ef_construction (int): HNSW, the size of the candidate list while building
+            lists (int, optional): IVFFlat, the number of lists. Defaults to rows / 1000 (sqrt(rows) above 1M rows)
 
+        returns:
+            bool: True if the index was created, False otherwise
+        '''
+        try:
+            collection_id = self._collection_id(project_name)
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                if method == "ivfflat" and lists is None:
+                    rows = conn.execute(
+                        text("SELECT count(*) FROM langchain_pg_embedding WHERE collection_id = :collection_id"),
+                        {"collection_id": collection_id}
+                    ).scalar()
+                    lists = max(int(rows ** 0.5) if rows > 1000000 else rows // 1000, 1)
+                conn.execute(text(vector_search.create_vector_index_sql(
+                    collection_id, self.embedding_dimensions, method=method, m=m, ef_construction=ef_construction, lists=lists or 100
+                )))
+            self.logger.info(f"Created {method} index for project: {project_name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error creating vector index: {e}")
+            return False
 
+    def list_vector_indexes(self, project_name: str) -> List[dict]:
+        '''
+        List the ANN indexes of a project with their size
+        '''
+        collection_id = self._collection_id(project_name)
+        names = [vector_search.vector_index_name(collection_id, method) for method in vector_search.VECTOR_INDEX_METHODS]
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT indexname, indexdef, pg_relation_size(indexname::regclass) AS size
+                FROM pg_indexes
+                WHERE tablename = 'langchain_pg_embedding' AND indexname = ANY(:names)
+            """), {"names": names}).all()
+        return [{"name": row.indexname, "definition": row.indexdef, "size": row.size} for row in rows]
+
+    def rebuild_vector_index(self, project_name: str) -> bool:
+        '''
+        Rebuild the ANN indexes of a project without blocking writes, e.g. after a large ingest into an IVFFlat index
+        '''
+        try:
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for index in self.list_vector_indexes(project_name):
+                    conn.execute(text(f"REINDEX INDEX CONCURRENTLY {index['name']}"))
+            return True
+        except Exception as e:
+            self.logger.error(f"Error rebuilding vector index: {e}")
+            return False
 
-        return result
+    def drop_vector_index(self, project_name: str) -> bool:
+        '''
+        Drop the ANN indexes of a project
+        '''
+        try:
+            collection_id = self._collection_id(project_name)
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for method in vector_search.VECTOR_INDEX_METHODS:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {vector_search.vector_index_name(collection_id, method)}"))
+            return True
+        except Exception as e:
+            self.logger.error(f"Error dropping vector index: {e}")
+            return False
  
     def create_project(self, name, description):
         """
@@ -280,15 +1026,12 @@ class DB:
 
             new_project = self.tables.Project(name=name, description=description)
             session.add(new_project)
+            self._notify_config_change(session)
             session.commit()
-            vectorstore = PGVector(
-                embeddings=self.embeddings,
-                collection_name=name,
-                connection=self.engine,
-                use_jsonb=True,
-            )
+            self._invalidate_vectorstore(name)
+            vectorstore = self._get_vectorstore(name)
             vectorstore.create_collection()
-            self.supabase.storage.create_bucket(name)
+            self.storage.create_bucket(name)
             self.logger.info(f"Added new project: {name}")
             return new_project.name
         
@@ -298,50 +1041,115 @@ class DB:
         finally:
             session.close()
 
-    def remove_project(self, project_name):
+    def remove_project(
+            self,
+            project_name: str,
+            background: bool = False,
+            progress: Optional[Callable[[str, int, int], None]] = None
+            ) -> bool | Future:
         """
-        Remove a project from the database.
+        Remove a project and all its data.
+
+        The teardown removes the uploaded files in batches and deletes the chunks, documents and links in
+        batches of DB_TEARDOWN_BATCH_SIZE rows, each in its own short transaction, so it never holds long locks.
 
         Args:
             project_name (str): The name of the project to remove.
+            background (bool): Run the teardown on a background thread and return a Future of the result.
+            progress (Callable, optional): Called with (stage, done, total) after every batch, stages are
+                "files", "chunks", "documents" and "links".
 
         Returns:
-            bool: True if the project was successfully removed, False otherwise.
-
-        Raises:
-            Exception: If there's an error during the database operation.
+            bool: True if the project was successfully removed, False otherwise. A Future of that result
+                when background is True.
         """
-        session = self.Session()
+        if background:
+            return _teardown_executor.submit(self._teardown_project, project_name, progress)
+        return self._teardown_project(project_name, progress)
+
+    def _delete_in_batches(self, table: str, condition: str, params: dict, stage: str, progress: Optional[Callable]) -> int:
+        '''
+        Delete the rows of a table that match a condition, one transaction per batch of DB_TEARDOWN_BATCH_SIZE rows
+        '''
+        with self.engine.connect() as conn:
+            total = conn.execute(text(f"SELECT count(*) FROM {table} WHERE {condition}"), params).scalar()
+        delete = text(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {condition} LIMIT :batch_size)")
+        done = 0
+        while True:
+            with self.engine.begin() as conn:
+                deleted = conn.execute(delete, {**params, "batch_size": self.teardown_batch_size}).rowcount
+            if deleted == 0:
+                break
+            done += deleted
+            if progress:
+                progress(stage, done, max(total, done))
+        return done
+
+    def _teardown_project(self, project_name: str, progress: Optional[Callable] = None) -> bool:
         try:
-            project = session.query(self.tables.Project).filter_by(name=project_name).first()
-            if project:
-                files = session.query(self.tables.Documents).filter_by(project_name=project_name, source="uploaded_file").all()
-                for file in files:
-                    self.supabase.storage.from_(project_name).remove([file.url])
-                session.query(self.tables.IndexedLinks).filter_by(project_name=project_name).delete()
-                session.query(self.tables.Documents).filter_by(project_name=project_name).delete()
-                session.delete(project)
-                session.commit()
-                vectorstore = PGVector(
-                    embeddings=self.embeddings,
-                    collection_name=project_name,
-                    connection=self.engine,
-                    use_jsonb=True,
-                )
-                vectorstore.delete_collection()
-                self.supabase.storage.delete_bucket(project_name)
-                self.logger.info(f"Removed project: {project_name}")
-                return True
-            else:
+            with self.engine.connect() as conn:
+                exists = conn.execute(text("SELECT 1 FROM projects WHERE name = :name"), {"name": project_name}).scalar()
+            if not exists:
                 self.logger.error(f"No project found with name: {project_name}")
                 return False
+
+            session = self.Session()
+            try:
+                files = [row.url for row in session.query(self.tables.Documents.url).filter_by(project_name=project_name, source="uploaded_file")]
+            finally:
+                session.close()
+            for done, batch in enumerate(batched(files, self.bulk_batch_size), start=1):
+                self.storage.remove(project_name, batch)
+                if progress:
+                    progress("files", min(done * self.bulk_batch_size, len(files)), len(files))
+
+            try:
+                collection_id = self._collection_id(project_name)
+            except ValueError:
+                collection_id = None
+            if collection_id:
+                self.drop_vector_index(project_name)
+                self._delete_in_batches("langchain_pg_embedding", "collection_id = CAST(:collection_id AS uuid)", {"collection_id": collection_id}, "chunks", progress)
+            self._delete_in_batches("document_metadata", "project_name = :project_name", {"project_name": project_name}, "documents", progress)
+            self._delete_in_batches("indexed_links", "project_name = :project_name", {"project_name": project_name}, "links", progress)
+
+            with self.engine.begin() as conn:
+                conn.execute(text("DELETE FROM langchain_pg_collection WHERE name = :name"), {"name": project_name})
+                conn.execute(text("DELETE FROM projects WHERE name = :name"), {"name": project_name})
+                self._notify_config_change(conn)
+            self._invalidate_vectorstore(project_name)
+            try:
+                self.storage.delete_bucket(project_name)
+            except Exception as e:
+                self.logger.warning(f"Unable to delete the storage bucket of {project_name}: {e}")
+            self.logger.info(f"Removed project: {project_name}")
+            return True
         except Exception as e:
-            session.rollback()
             self.logger.error(f"Error removing project: {e}")
             return False
-        finally:
-            session.close()
- 
+
+    def _start_config_listener(self) -> None:
+        '''
+        Start the process-wide listener that clears the prompt, API key and collection caches when another process
+        changes them
+        '''
+        global _config_listener
+        with _config_listener_lock:
+            if _config_listener is None or not _config_listener.is_alive():
+                def connect():
+                    # A dedicated connection outside the pool: it is held for the lifetime of the process, and a pooled
+                    # connection can still be inside the transaction of its pre-ping, where autocommit cannot be set
+                    return psycopg2.connect(self.db_url)
+                _config_listener = InvalidationListener(connect, CONFIG_CHANNEL, _clear_shared_caches)
+                _config_listener.start()
+
+    def _notify_config_change(self, session) -> None:
+        '''
+        Notify the other processes that prompts, API keys or projects changed, the notification is sent when the session commits
+        '''
+        if self.cache_notify:
+            session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CONFIG_CHANNEL})
+
     def add_prompt(self, name, prompt_text):
         """
         Add a new prompt to the database.
@@ -361,7 +1169,9 @@ class DB:
         try:
             new_prompt = self.tables.Prompt(name=name, prompt=prompt_text)
             session.add(new_prompt)
+            self._notify_config_change(session)
             session.commit()
+            _config_cache.clear()
             print(f"Added new prompt: {name}")
             return new_prompt.id
         except Exception as e:
@@ -395,7 +1205,9 @@ class DB:
                 if prompt_text:
                     prompt.prompt = prompt_text
                 prompt.update_date = datetime.now(pytz.UTC)
+                self._notify_config_change(session)
                 session.commit()
+                _config_cache.clear()
                 print(f"Updated prompt with ID: {prompt_id}")
                 return True
             else:
@@ -412,13 +1224,17 @@ class DB:
 
     def get_prompt_by_name(self, name):
         """
-        Get a prompt from the database by its name.
+        Get a prompt from the database by its name, cached for CONFIG_CACHE_TTL seconds.
         """
+        cached = _config_cache.get(("prompt", name))
+        if cached is not None:
+            return cached
         session = self.Session()
         self.logger.info(f"Retrieving prompt by name: {name}")
         try:
             prompt = session.query(self.tables.Prompt).filter_by(name=name).first()
             if prompt:
+                _config_cache.set(("prompt", name), prompt.prompt)
                 return prompt.prompt
             else:
                 self.logger.error(f"No prompt found with name: {name}")
@@ -447,7 +1263,9 @@ class DB:
             prompt = session.query(self.tables.Prompt).filter_by(id=prompt_id).first()
             if prompt:
                 session.delete(prompt)
+                self._notify_config_change(session)
                 session.commit()
+                _config_cache.clear()
                 print(f"Removed prompt with ID: {prompt_id}")
                 return True
             else:
@@ -468,16 +1286,23 @@ class DB:
             list: A list of all Prompt objects stored in the database.
 
         Note:
-            This method creates a new session, queries all prompts, and closes the session
-            after the query is executed, regardless of whether an exception occurs.
+            The column values of the prompts are cached for CONFIG_CACHE_TTL seconds, every call returns new
+            Prompt objects, so callers never share them. A cache miss creates a new session, queries all prompts,
+            and closes the session after the query is executed.
         """
-        session = self.Session()
-        self.logger.info("Retrieving all prompts")
-        try:
-            prompts = session.query(self.tables.Prompt).all()
-            return prompts
-        finally:
-            session.close()
+        rows = _config_cache.get(("prompts",))
+        if rows is None:
+            session = self.Session()
+            self.logger.info("Retrieving all prompts")
+            try:
+                rows = tuple(
+                    tuple(getattr(prompt, column) for column in PROMPT_COLUMNS)
+                    for prompt in session.query(self.tables.Prompt).all()
+                )
+                _config_cache.set(("prompts",), rows)
+            finally:
+                session.close()
+        return [self.tables.Prompt(**dict(zip(PROMPT_COLUMNS, row))) for row in rows]
     
     def add_api_key(self, name, key):
         """
@@ -498,7 +1323,9 @@ class DB:
         try:
             new_key = self.tables.APIKeys(name=name, key=key)
             session.add(new_key)
+            self._notify_config_change(session)
             session.commit()
+            _config_cache.clear()
             print(f"Added new API key: {name}")
             return new_key.id
         except Exception as e:
@@ -526,7 +1353,9 @@ class DB:
             key = session.query(self.tables.APIKeys).filter_by(name=name).first()
             if key:
                 session.delete(key)
+                self._notify_config_change(session)
                 session.commit()
+                _config_cache.clear()
                 print(f"Removed API key: {name}")
                 return True
             else:
@@ -542,13 +1371,17 @@ class DB:
 
     def get_api_key_by_name(self, name):
         """
-        Get an API key from the database by its name.
+        Get an API key from the database by its name, cached for CONFIG_CACHE_TTL seconds.
         """
+        cached = _config_cache.get(("api_key", name))
+        if cached is not None:
+            return cached
         session = self.Session()
         self.logger.info(f"Retrieving API key by name: {name}")
         try:
             key = session.query(self.tables.APIKeys).filter_by(name=name).first()
             if key:
+                _config_cache.set(("api_key", name), key.key)
                 return key.key
             else:
                 self.logger.error(f"No API key found with name: {name}")
@@ -570,16 +1403,29 @@ class DB:
         finally:
             session.close()
         
-    def add_links_to_index(self, status :str, links: List[str], base_url : str, project_name: str):
+    def add_links_to_index(self, status :str, links: List[str], base_url : str, project_name: str, batch_size: Optional[int] = None):
         '''
         Add a list of links to the database
+
+        Links are written with multi-row upserts of batch_size rows, a link that is already
+        known for the project gets the new status and base URL.
         '''
+        batch_size = batch_size or self.bulk_batch_size
         session = self.Session()
         self.logger.info(f"Adding links to confirm for base URL: {base_url}")
         try:
-            for link in links:
-                new_link = self.tables.IndexedLinks(url=link, status=status ,base_url=base_url, project_name=project_name)
-                session.add(new_link)
+            now = datetime.now(pytz.UTC)
+            self._bulk_upsert(
+                session,
+                table=self.tables.IndexedLinks.__tablename__,
+                rows=[
+                    {"url": link, "status": status, "base_url": base_url, "project_name": project_name, "creation_date": now, "update_date": now}
+                    for link in dict.fromkeys(links)
+                ],
+                constraint='uq_url_project',
+                set_={"status": "EXCLUDED.status", "base_url": "EXCLUDED.base_url", "update_date": "EXCLUDED.update_date"},
+                batch_size=batch_size
+            )
             session.commit()
         except Exception as e:
             session.rollback()
@@ -628,93 +1474,146 @@ class DB:
         finally:
             session.close()
 
-    def get_links_to_confirm(self, project_name: str) -> List[dict] | None:
+    def list_links_by_status(self, project_name: str, status: str, limit: int = 1000, after_id: Optional[int] = None) -> List[dict]:
         '''
-        Return a list of all links that can be confirmed for scraping
+        List the links of a project with a given status one page at a time, ordered by id
+
+        args:
+            project_name (str): The name of the project
+            status (str): The status of the links
+            limit (int): The maximum number of links to return
+            after_id (int, optional): The id of the last link of the previous page
+
+        returns:
+            List[dict]: The id, url and base_url of every link on the page
         '''
+        IndexedLinks = self.tables.IndexedLinks
         session = self.Session()
+        try:
+            query = session.query(IndexedLinks.id, IndexedLinks.url, IndexedLinks.base_url).filter(
+                IndexedLinks.project_name == project_name,
+                IndexedLinks.status == status
+            )
+            if after_id is not None:
+                query = query.filter(IndexedLinks.id > after_id)
+            return [row._asdict() for row in query.order_by(IndexedLinks.id).limit(limit).all()]
+        finally:
+            session.close()
+
+    def get_links_to_confirm(self, project_name: str) -> List[dict] | None:
+        '''
+        Return a list of all links that can be confirmed for scraping, read in pages of DB_BULK_BATCH_SIZE links
+        '''
         self.logger.info(f"Getting links to confirm for project: {project_name}")
         try:
-            links = session.query(self.tables.IndexedLinks).filter_by(project_name=project_name, status="Confirm page import").all()
-            return [{"url": l.url, "base_url": l.base_url} for l in links]
+            links = []
+            after_id = None
+            while True:
+                page = self.list_links_by_status(project_name, "Confirm page import", limit=self.bulk_batch_size, after_id=after_id)
+                links.extend({"url": link["url"], "base_url": link["base_url"]} for link in page)
+                if len(page) < self.bulk_batch_size:
+                    return links
+                after_id = page[-1]["id"]
         except Exception as e:
             self.logger.error(f"Error getting links to confirm: {e}")
-        finally:
-            session.close()
 
-    def update_indexed_link_status(self, url: str, project_name: str, status: str):
+    def update_indexed_link_statuses(self, urls: List[str], project_name: str, status: str) -> int:
         '''
-        Update the status of an indexed link
+        Set the status of many links of a project, with one UPDATE per batch of DB_BULK_BATCH_SIZE URLs
+
+        returns:
+            int: The number of updated links
         '''
+        query = text("""
+            UPDATE indexed_links
+            SET status = :status, update_date = :update_date
+            WHERE project_name = :project_name AND url = ANY(:urls)
+        """)
         session = self.Session()
+        updated = 0
         try:
-            session.query(self.tables.IndexedLinks).filter_by(url=url, project_name=project_name).update({"status": status})
+            now = datetime.now(pytz.UTC)
+            for batch in batched(dict.fromkeys(urls), self.bulk_batch_size):
+                result = session.execute(query, {"status": status, "update_date": now, "project_name": project_name, "urls": batch})
+                updated += result.rowcount
             session.commit()
-            self.logger.debug(f"Updated indexed link status: {url}")
+            self.logger.debug(f"Updated the status of {updated} indexed links to {status}")
+            return updated
         except Exception as e:
             session.rollback()
-            self.logger.error(f"Error updating indexed link status: {e}")
+            self.logger.error(f"Error updating indexed link statuses: {e}")
+            return 0
         finally:
             session.close()
 
-    def add_file(self, project_name: str, document_data: tuple):
+    def update_indexed_link_status(self, url: str, project_name: str, status: str):
+        '''
+        Update the status of an indexed link
+        '''
+        self.update_indexed_link_statuses([url], project_name, status)
+
+    def add_file(self, project_name: str, document_data: Tuple[bytes | BinaryIO, str]) -> str:
         '''
-        Add an uploaded file to the database
+        Upload a file to the object store of a project
+
+        The data is sent straight from memory, or streamed from a binary file-like object, without a temporary copy on disk.
 
         args:
-        document_data (tuple): List of tuples containing (bytes_data, filename)
+        document_data (tuple): (data, filename), data is bytes or a binary file-like object
         project_name (str): The name of the project to associate the document with
 
-
+        returns:
+            str: The path of the file in the project bucket
         '''
-        filename = document_data[1]
+        data, filename = document_data
         file_extension = filename.split(".")[-1]
+        path_on_supastorage = f"{str(uuid.uuid4())}.{file_extension}"
+
+        try:
+            self.storage.upload(project_name, path_on_supastorage, data, mime_type(filename))
+            self.logger.info(f"Added uploaded file: {filename}")
+        except Exception as e:
+            self.logger.error(f"Error adding uploaded file: {e}")
+        return path_on_supastorage
 
-        file_uuid = str(uuid.uuid4())
-        path_on_supastorage = f"{str(file_uuid)}.{file_extension}"
+    def add_files(self, project_name: str, document_data: List[Tuple[bytes | BinaryIO, str]]) -> List[str]:
+        '''
+        Upload several files to the object storage of a project concurrently
 
-        # Temporary store the file
-        file_path = f"temp/{str(file_uuid)}/{filename}"
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'wb') as f:
-            f.write(document_data[0])
+        args:
+        document_data (List[tuple]): List of tuples containing (data, filename)
+        project_name (str): The name of the project to associate the documents with
 
+        returns:
+            List[str]: The path of every file in the project bucket, in the order of document_data
+        '''
+        if len(document_data) <= 1:
+            return [self.add_file(project_name, data) for data in document_data]
+        workers = min(int(os.getenv('STORAGE_UPLOAD_WORKERS', 4)), len(document_data))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda data: self.add_file(project_name, data), document_data))
 
+    def _sign_urls(self, project_name: str, paths: List[str]) -> Dict[str, str]:
+        '''
+        Return a signed download URL for every path in a project bucket
 
-        session = self.Session()
-        try:
-                # Caluculate MIME type
-            if file_extension == "pdf":
-                mime_type = "application/pdf"
-            elif file_extension == "txt":
-                mime_type = "text/plain"
-            elif file_extension == "docx":
-                mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            elif file_extension == "pptx":
-                mime_type = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        URLs are served from the cache while they remain valid for at least SIGNED_URL_REFRESH seconds,
+        the others are signed in batches of bulk_batch_size paths per storage request.
+        '''
+        signed = {}
+        missing = []
+        for path in paths:
+            url = self.signed_urls.get((project_name, path))
+            if url is None:
+                missing.append(path)
             else:
-                mime_type = "text/html"
-
-            with open(file_path, 'rb') as f:
-                self.supabase.storage.from_(project_name).upload(
-                    file=f,
-                    path=path_on_supastorage,
-                    file_options={
-                        "content-type": mime_type
-                    }
-                    )
-            session.commit()
-            self.logger.info(f"Added uploaded file: {filename}")
-            # Remove the temporary file and it's folder
-            os.remove(file_path)
-            os.rmdir(os.path.dirname(file_path))
+                signed[path] = url
 
-        except Exception as e:
-            session.rollback()
-            self.logger.error(f"Error adding uploaded file: {e}")
-        finally:
-            session.close()
-            return path_on_supastorage
+        for batch in batched(missing, self.bulk_batch_size):
+            for path, url in self.storage.sign_urls(project_name, batch, expires_in=self.signed_url_expiry).items():
+                self.signed_urls.set((project_name, path), url)
+                signed[path] = url
+        return signed
 
     def list_files(self, project_name: str):
         '''
@@ -725,12 +1624,12 @@ class DB:
         file_details = []
         try:
             files = session.query(self.tables.Documents).filter_by(project_name=project_name, source="uploaded_file").all()
+            signed_urls = self._sign_urls(project_name, [file.url for file in files])
             for file in files:
-                signed_url = self.supabase.storage.from_(project_name).create_signed_url(file.url, expires_in=3600)
                 file_details.append(
                     {
                         "filename": file.filename,
-                        "signed_download_url": signed_url['signedURL'],
+                        "signed_download_url": signed_urls.get(file.url),
                         "creation_date": file.creation_date,
                         "last_modified_date": file.last_modified_date
                     }
@@ -741,6 +1640,17 @@ class DB:
         finally:
             session.close()
 
+    def read_file(self, project_name: str, file_name: str):
+        '''
+        Read an uploaded file from the object store, None if the file is unknown
+
+        The local store returns a read-only memory map of the file, the other stores return bytes.
+        '''
+        file = self.get_uploaded_file(project_name, file_name)
+        if file is None:
+            return None
+        return self.storage.read(project_name, file["url"])
+
     def remove_file(self, project_name: str, file_name: str):
         '''
         Remove an uploaded file from the database
@@ -748,11 +1658,13 @@ class DB:
         session = self.Session()
         try:
             file_url = session.query(self.tables.Documents).filter_by(project_name=project_name, filename=file_name, source="uploaded_file").first()
+            if file_url is None:
+                self.logger.error(f"Error removing uploaded file: {file_name} not found")
+                return None
             url = file_url.url
-            self.supabase.storage.from_(project_name).remove([url])
-            session.query(self.tables.Documents).filter_by(project_name=project_name, filename=file_name, source="uploaded_file").delete()
-            self.remove_by_url(project_name, url)
-            session.commit()
+            self.storage.remove(project_name, [url])
+            self.signed_urls.pop((project_name, url))
+            self.remove_by_urls(project_name, [url], include_metadata=True)
             self.logger.info(f"Removed uploaded file: {file_name}")
         except Exception as e:
             session.rollback()
@@ -760,17 +1672,57 @@ class DB:
         finally:
             session.close()
 
-    def run_query(self, query: str):
+    def stream_query(
+            self,
+            query: str,
+            params: Optional[dict] = None,
+            batch_size: Optional[int] = None,
+            max_rows: Optional[int] = None,
+            timeout: Optional[int] = None,
+            read_only: bool = True
+            ) -> Iterator[dict]:
         '''
-        Run a SQL query on the database
+        Run a SQL query and stream its rows through a server-side cursor
+
+        args:
+            query (str): The SQL query
+            params (dict, optional): The bind parameters of the query
+            batch_size (int, optional): The number of rows fetched per round trip, defaults to QUERY_BATCH_SIZE
+            max_rows (int, optional): Stop after this many rows, defaults to QUERY_MAX_ROWS
+            timeout (int, optional): The statement timeout in milliseconds, defaults to QUERY_STATEMENT_TIMEOUT
+            read_only (bool): Run the query in a read-only transaction (on DB_READONLY_URL when it is set)
+
+        returns:
+            Iterator[dict]: The rows, as column name to value mappings
+        '''
+        batch_size = batch_size or self.query_batch_size
+        max_rows = max_rows or self.query_max_rows
+        engine = self.readonly_engine if read_only else self.engine
+        with engine.connect() as conn:
+            with conn.begin():
+                conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout or self.query_timeout)}"))
+                result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(text(query), params or {})
+                if not result.returns_rows:
+                    return
+                rows = 0
+                for partition in result.mappings().partitions(batch_size):
+                    for row in partition:
+                        if rows == max_rows:
+                            self.logger.warning(f"Query stopped after {max_rows} rows")
+                            result.close()
+                            return
+                        rows += 1
+                        yield dict(row)
+
+    def run_query(self, query: str, max_rows: Optional[int] = None):
+        '''
+        Run a read-only SQL query on the database
+
+        returns:
+            List[dict]: At most max_rows rows (QUERY_MAX_ROWS by default), or the error message if the query failed
         '''
-        session = self.Session()
         try:
-            result = session.execute(text(query))
-            return result
+            return list(self.stream_query(query, max_rows=max_rows))
         except Exception as e:
             self.logger.error(f"Error running query: {e}")
             return str(e)
-        finally:
-            session.close()
-            
\ No newline at end of file
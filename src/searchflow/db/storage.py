@@ -0,0 +1,183 @@
+import io
+import os
+import mmap
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+from searchflow import logger
+
+
+class ObjectStore(ABC):
+    """
+    Object storage for the uploaded files, one bucket per project.
+    """
+
+    @abstractmethod
+    def create_bucket(self, bucket: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete_bucket(self, bucket: str) -> None:
+        ...
+
+    @abstractmethod
+    def upload(self, bucket: str, path: str, data: bytes | BinaryIO, content_type: str) -> None:
+        ...
+
+    @abstractmethod
+    def read(self, bucket: str, path: str) -> bytes | mmap.mmap:
+        ...
+
+    @abstractmethod
+    def remove(self, bucket: str, paths: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def sign_urls(self, bucket: str, paths: List[str], expires_in: int) -> Dict[str, str]:
+        """
+        Return a download URL for every path, paths that could not be signed are left out.
+        """
+        ...
+
+
+class SupabaseStore(ObjectStore):
+    """
+    Supabase storage. The client is created on first use, so a DB can start without Supabase credentials
+    as long as no file is stored.
+    """
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None):
+        self.url = url or os.environ.get("SUPABASE_URL")
+        self.key = key or os.environ.get("SUPABASE_KEY")
+        self.logger = logger.setup_logger(name="SupabaseStore", level="WARNING")
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self.url, self.key)
+        return self._client
+
+    def create_bucket(self, bucket: str) -> None:
+        self.client.storage.create_bucket(bucket)
+
+    def delete_bucket(self, bucket: str) -> None:
+        self.client.storage.delete_bucket(bucket)
+
+    def upload(self, bucket: str, path: str, data: bytes | BinaryIO, content_type: str) -> None:
+        # storage3 streams bytes and open files, other file-like objects are read into memory
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
+        elif not isinstance(data, (bytes, io.BufferedReader, io.FileIO)):
+            data = data.read()
+        self.client.storage.from_(bucket).upload(file=data, path=path, file_options={"content-type": content_type})
+
+    def read(self, bucket: str, path: str) -> bytes:
+        return self.client.storage.from_(bucket).download(path)
+
+    def remove(self, bucket: str, paths: List[str]) -> None:
+        if paths:
+            self.client.storage.from_(bucket).remove(paths)
+
+    def sign_urls(self, bucket: str, paths: List[str], expires_in: int) -> Dict[str, str]:
+        if not paths:
+            return {}
+        bucket_api = self.client.storage.from_(bucket)
+        # storage3's create_signed_urls raises on the first path without a signedURL (e.g. a missing object),
+        # so the batch endpoint is called directly and every item is checked on its own
+        try:
+            response = bucket_api._request("POST", f"/object/sign/{bucket_api.id}", json={"paths": paths, "expiresIn": str(expires_in)})
+            items = response.json()
+        except Exception as e:
+            self.logger.warning(f"Unable to sign the URLs of {bucket} in one batch, signing them one by one: {e}")
+            return self._sign_urls_one_by_one(bucket_api, paths, expires_in)
+        signed = {}
+        base_url = str(bucket_api._client.base_url)
+        for item in items:
+            if item.get("error") or not item.get("signedURL"):
+                self.logger.warning(f"Unable to sign {item.get('path')}: {item.get('error')}")
+                continue
+            signed[item["path"]] = f"{base_url}{item['signedURL'].lstrip('/')}"
+        return signed
+
+    def _sign_urls_one_by_one(self, bucket_api, paths: List[str], expires_in: int) -> Dict[str, str]:
+        signed = {}
+        for path in paths:
+            try:
+                signed[path] = bucket_api.create_signed_url(path, expires_in)["signedURL"]
+            except Exception as e:
+                self.logger.warning(f"Unable to sign {path}: {e}")
+        return signed
+
+
+class LocalStore(ObjectStore):
+    """
+    Stores the files on the local filesystem under root/<bucket>/<path>, for single-node and test
+    deployments. Files are read through a read-only memory map instead of being copied into memory.
+    There are no download URLs, a browser cannot open file:// links from the app, so the files are
+    downloaded through DB.read_file.
+    """
+    def __init__(self, root: str = "storage"):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _resolve(self, bucket: str, path: str = "") -> Path:
+        bucket_dir = (self.root / bucket).resolve()
+        resolved = (bucket_dir / path).resolve()
+        if bucket_dir.parent != self.root or not resolved.is_relative_to(bucket_dir):
+            raise ValueError(f"Invalid storage path: {bucket}/{path}")
+        return resolved
+
+    def create_bucket(self, bucket: str) -> None:
+        self._resolve(bucket).mkdir(parents=True, exist_ok=True)
+
+    def delete_bucket(self, bucket: str) -> None:
+        shutil.rmtree(self._resolve(bucket), ignore_errors=True)
+
+    def upload(self, bucket: str, path: str, data: bytes | BinaryIO, content_type: str) -> None:
+        target = self._resolve(bucket, path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the target and rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+            os.replace(temp_path, target)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def read(self, bucket: str, path: str) -> bytes | mmap.mmap:
+        with open(self._resolve(bucket, path), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def remove(self, bucket: str, paths: List[str]) -> None:
+        for path in paths:
+            self._resolve(bucket, path).unlink(missing_ok=True)
+
+    def sign_urls(self, bucket: str, paths: List[str], expires_in: int) -> Dict[str, str]:
+        return {}
+
+
+def get_object_store() -> ObjectStore:
+    """
+    Return the object store selected by STORAGE_BACKEND: "supabase" (default) or "local",
+    which keeps the files under STORAGE_PATH (default "storage").
+    """
+    backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
+    if backend == "supabase":
+        return SupabaseStore()
+    if backend == "local":
+        return LocalStore(os.getenv("STORAGE_PATH", "storage"))
+    raise ValueError(f"Invalid storage backend: {backend}. Valid backends are ['supabase', 'local']")
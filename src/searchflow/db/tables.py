@@ -1,14 +1,47 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint, Float, ARRAY
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint, Index, Float, ARRAY, REAL, text
 from datetime import datetime
 import pytz
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Idempotent DDL for databases created before a column or index was added to the models below
+SCHEMA_UPGRADES = [
+    "ALTER TABLE document_metadata ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+]
+
+# Idempotent DDL for the PGVector tables, which are created by langchain_postgres
+VECTORSTORE_SCHEMA_UPGRADES = [
+    # Link every chunk to its document, so deleting a document removes its chunks
+    "ALTER TABLE langchain_pg_embedding ADD COLUMN IF NOT EXISTS document_id INTEGER REFERENCES document_metadata(id) ON DELETE CASCADE",
+]
+
+# Indexes added to tables that can be large in existing databases, by name. They are built with
+# CREATE INDEX CONCURRENTLY outside a transaction, so writes go on while they are built (see DB.create_concurrent_indexes)
+CONCURRENT_INDEXES = {
+    "ix_document_metadata_project_id": "document_metadata (project_name, id)",
+    "ix_indexed_links_project_status_id": "indexed_links (project_name, status, id)",
+    "ix_embedding_document_id": "langchain_pg_embedding (document_id)",
+    "ix_embedding_collection_url": "langchain_pg_embedding (collection_id, (cmetadata->>'url'))",
+}
+
+
+def run_schema_upgrades(engine, statements: list) -> None:
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
 
 class Tables:
     def __init__(self, engine):
-        Base.metadata.create_all(engine)
+        self.engine = engine
+
+    def migrate(self) -> None:
+        '''
+        Create the missing tables and apply the schema upgrades
+        '''
+        Base.metadata.create_all(self.engine)
+        run_schema_upgrades(self.engine, SCHEMA_UPGRADES)
 
 
     class Prompt(Base):
@@ -45,6 +78,7 @@ class Tables:
         update_date = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.UTC), onupdate=lambda: datetime.now(pytz.UTC))
         __table_args__ = (
             UniqueConstraint('url', 'project_name', name='uq_url_project'),
+            Index('ix_indexed_links_project_status_id', 'project_name', 'status', 'id'),  # keyset pagination per status
         )
 
     class Documents(Base):
@@ -68,7 +102,16 @@ class Tables:
         creation_date = Column(DateTime(timezone=True))
         last_modified_date = Column(DateTime(timezone=True))
         upload_date = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.UTC))
+        content_hash = Column(String(64))  # sha256 of the content, used to skip unchanged documents on re-import
         
         __table_args__ = (
             UniqueConstraint('url', 'project_name', name='uq_doc_url_project'),
-        )
\ No newline at end of file
+            Index('ix_document_metadata_project_id', 'project_name', 'id'),  # statistics and keyset pagination per project
+        )
+
+    class EmbeddingCache(Base):
+        __tablename__ = 'embedding_cache'
+        content_hash = Column(String(64), primary_key=True)  # sha256 of the embedded text
+        model = Column(String(255), primary_key=True)
+        embedding = Column(ARRAY(REAL), nullable=False)
+        creation_date = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.UTC))
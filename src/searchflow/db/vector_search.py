@@ -0,0 +1,226 @@
+import uuid
+from typing import List, Tuple, Optional
+from sqlalchemy import text
+from langchain_core.documents import Document
+
+
+# Operator classes per index method, the PGVector collections use the cosine distance
+VECTOR_INDEX_METHODS = {
+    "hnsw": "vector_cosine_ops",
+    "ivfflat": "vector_cosine_ops",
+}
+
+
+# The full-text index is an expression index, so adding it does not rewrite langchain_pg_embedding
+FULLTEXT_INDEX_NAME = "ix_embedding_document_fts"
+
+
+def fulltext_vector(alias: str = "e") -> str:
+    """
+    Return the tsvector expression of the chunk text, the queries must use the exact expression of the index.
+    'simple' since the collections are multilingual.
+    """
+    column = f"{alias}.document" if alias else "document"
+    return f"to_tsvector('simple', coalesce({column}, ''))"
+
+
+def create_fulltext_index_sql() -> str:
+    """
+    Build the CREATE INDEX statement of the GIN index used by the lexical side of hybrid_query.
+    """
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {FULLTEXT_INDEX_NAME} "
+        f"ON langchain_pg_embedding USING gin (({fulltext_vector('')}))"
+    )
+
+
+def index_valid_query():
+    """
+    Return whether the index :name is valid: NULL when it does not exist, false while it is built concurrently
+    or after an interrupted build.
+    """
+    return text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)")
+
+
+def vector_index_name(collection_id: str, method: str) -> str:
+    """
+    Return the name of the partial ANN index of a collection.
+    """
+    return f"ix_embedding_{method}_{uuid.UUID(str(collection_id)).hex}"
+
+
+def create_vector_index_sql(
+        collection_id: str,
+        dimensions: int,
+        method: str = "hnsw",
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: int = 100
+        ) -> str:
+    """
+    Build the CREATE INDEX statement of a partial HNSW or IVFFlat index over the chunks of one collection.
+
+    The embedding column of langchain_pg_embedding has no fixed dimension, so the index is built on
+    embedding::vector(dimensions), the expression used by similarity_query.
+    """
+    if method not in VECTOR_INDEX_METHODS:
+        raise ValueError(f"Invalid index method: {method}. Valid methods are {list(VECTOR_INDEX_METHODS)}")
+
+    if method == "hnsw":
+        options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    else:
+        options = f"lists = {int(lists)}"
+
+    collection_id = str(uuid.UUID(str(collection_id)))
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {vector_index_name(collection_id, method)} "
+        f"ON langchain_pg_embedding USING {method} ((embedding::vector({int(dimensions)})) {VECTOR_INDEX_METHODS[method]}) "
+        f"WITH ({options}) WHERE collection_id = '{collection_id}'"
+    )
+
+
+def search_settings(ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[str]:
+    """
+    Return the SET LOCAL statements for the query-time knobs of the ANN indexes.
+
+    Args:
+        ef_search (int, optional): The size of the HNSW candidate list, higher is more accurate and slower.
+        probes (int, optional): The number of IVFFlat lists to scan, higher is more accurate and slower.
+    """
+    settings = []
+    if ef_search:
+        settings.append(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+    if probes:
+        settings.append(f"SET LOCAL ivfflat.probes = {int(probes)}")
+    return settings
+
+
+def similarity_query(collection_id: str, dimensions: int, conditions: str = ""):
+    """
+    Build the nearest neighbour query over one collection.
+
+    The collection id is inlined so the planner can match the partial ANN index of the collection.
+    Bind parameters: embedding (the query vector as text), k and those of the extra conditions
+    (see SearchFilter.compile).
+    """
+    collection_id = str(uuid.UUID(str(collection_id)))
+    return text(f"""
+        SELECT
+            e.id,
+            e.document,
+            e.cmetadata,
+            e.embedding::vector({int(dimensions)}) <=> CAST(CAST(:embedding AS text) AS vector({int(dimensions)})) AS distance
+        FROM langchain_pg_embedding AS e
+        WHERE e.collection_id = '{collection_id}'{conditions}
+        ORDER BY distance
+        LIMIT :k
+    """)
+
+
+def hybrid_query(collection_id: str, dimensions: int, conditions: str = ""):
+    """
+    Build a single query that runs a nearest neighbour search and a full-text search over one collection
+    and fuses both rankings with reciprocal rank fusion: score = sum(1 / (rrf_k + rank)).
+
+    The full-text side matches chunks containing any term of the question (an OR query) and ranks them with
+    ts_rank_cd, scaled to [0, 1). Terms the planner statistics of the full-text index show in more than max_term_frequency of
+    all chunks (stopwords, as the 'simple' configuration keeps them) are left out of the query.
+
+    Bind parameters: embedding (the query vector as text), query (the question), max_term_frequency,
+    candidates (the number of hits taken from each ranking), rrf_k, k and those of the extra conditions
+    (see SearchFilter.compile).
+    """
+    collection_id = str(uuid.UUID(str(collection_id)))
+    distance = f"e.embedding::vector({int(dimensions)}) <=> CAST(CAST(:embedding AS text) AS vector({int(dimensions)}))"
+    return text(f"""
+        WITH common_terms AS (
+            SELECT term
+            FROM pg_stats AS s,
+                unnest(s.most_common_elems::text::text[], s.most_common_elem_freqs) AS t(term, frequency)
+            WHERE s.schemaname = current_schema() AND s.tablename = '{FULLTEXT_INDEX_NAME}'
+                AND t.frequency > :max_term_frequency
+        ),
+        lexical_query AS (
+            SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | ')) AS query
+            FROM unnest(tsvector_to_array(to_tsvector('simple', CAST(:query AS text)))) AS lexeme
+            WHERE lexeme NOT IN (SELECT term FROM common_terms WHERE term IS NOT NULL)
+        ),
+        vector_hits AS (
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank
+            FROM (
+                SELECT e.id, {distance} AS distance
+                FROM langchain_pg_embedding AS e
+                WHERE e.collection_id = '{collection_id}'{conditions}
+                ORDER BY distance
+                LIMIT :candidates
+            ) AS nearest
+        ),
+        lexical_hits AS (
+            SELECT id, score, row_number() OVER (ORDER BY score DESC) AS rank
+            FROM (
+                SELECT e.id, ts_rank_cd({fulltext_vector()}, q.query, 32) AS score
+                FROM langchain_pg_embedding AS e, lexical_query AS q
+                WHERE e.collection_id = '{collection_id}' AND {fulltext_vector()} @@ q.query{conditions}
+                ORDER BY score DESC
+                LIMIT :candidates
+            ) AS matches
+        ),
+        fused AS (
+            SELECT
+                coalesce(v.id, l.id) AS id,
+                coalesce(1.0 / (:rrf_k + v.rank), 0) + coalesce(1.0 / (:rrf_k + l.rank), 0) AS rrf_score,
+                v.rank AS vector_rank,
+                l.rank AS lexical_rank,
+                l.score AS lexical_score
+            FROM vector_hits AS v
+            FULL OUTER JOIN lexical_hits AS l ON v.id = l.id
+        )
+        SELECT
+            e.id,
+            e.document,
+            e.cmetadata,
+            {distance} AS distance,
+            f.rrf_score,
+            f.vector_rank,
+            f.lexical_rank,
+            f.lexical_score
+        FROM fused AS f
+        JOIN langchain_pg_embedding AS e ON e.id = f.id
+        ORDER BY f.rrf_score DESC
+        LIMIT :k
+    """)
+
+
+def hybrid_rows_to_documents(rows) -> List[Tuple[Document, float]]:
+    """
+    Convert the rows of hybrid_query to documents with their relevance score (1 - cosine distance).
+    The fusion score, the rank in both result lists and the full-text score are added to the metadata.
+    """
+    results = []
+    for row in rows:
+        metadata = dict(row.cmetadata or {})
+        metadata.update({
+            "rrf_score": float(row.rrf_score),
+            "vector_rank": row.vector_rank,
+            "lexical_rank": row.lexical_rank,
+            "lexical_score": float(row.lexical_score) if row.lexical_score is not None else None,
+        })
+        results.append((Document(page_content=row.document, metadata=metadata), 1.0 - row.distance))
+    return results
+
+
+def vector_literal(embedding: List[float]) -> str:
+    """
+    Format a vector as a pgvector text literal.
+    """
+    return "[" + ",".join(str(float(value)) for value in embedding) + "]"
+
+
+def rows_to_documents(rows) -> List[Tuple[Document, float]]:
+    """
+    Convert the rows of similarity_query to documents with their relevance score (1 - cosine distance).
+    """
+    return [
+        (Document(page_content=row.document, metadata=row.cmetadata), 1.0 - row.distance)
+        for row in rows
+    ]
@@ -1,11 +1,11 @@
 from typing import Literal, Optional, List
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain import hub
 from searchflow.models import DocumentMetaData
 from langchain_core.documents import Document
 from pydantic import BaseModel
 from searchflow import logger
+from searchflow.db.postgresql import hash_content
+from searchflow.llm.providers import get_chat_model, pull_prompt
 
 class ExtractionObject(BaseModel):
     title: str
@@ -17,6 +17,7 @@ class ExtractionObject(BaseModel):
     filename: Optional[str] = ""
     creation_date: Optional[datetime] = None
     last_modified_date: Optional[datetime] = None
+    content_hash: Optional[str] = None
     
 
 class ExtractMetaData:
@@ -27,8 +28,8 @@ class ExtractMetaData:
         llm: langchain llm object
     '''
     def __init__(self):
-        self.llm_with_tools = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-        self.prompt = hub.pull("entity_extraction")
+        self.llm_with_tools = get_chat_model("openai", "gpt-4o-mini", temperature=0)
+        self.prompt = pull_prompt("entity_extraction")
         self.logger = logger.setup_logger('ExtractMetaData')
 
     @staticmethod
@@ -64,7 +65,8 @@ class ExtractMetaData:
                 read_time=self._calculate_read_time(self._calculate_word_count(doc.content)),
                 creation_date=doc.creation_date,
                 last_modified_date=doc.last_modified_date,
-                filename=doc.filename
+                filename=doc.filename,
+                content_hash=doc.content_hash or hash_content(doc.content)
             )
             results.append(Document(
                 page_content=doc.content,
@@ -17,15 +17,16 @@ from searchflow.graphs.utils.nodes import (
     rewrite_question,
     final_answer
 )
-from searchflow import DB
+from searchflow import get_db
 
-db = DB()
-projects = db.list_projects()
+projects = get_db().list_projects()
 
 # Define the config
 class GraphConfig(TypedDict):
     project_name: Literal[*projects]
     internet_search: bool
+    hybrid_search: bool
+    search_filter: dict
 
 workflow = StateGraph(OverallState, config_schema=GraphConfig)
 
@@ -1,8 +1,6 @@
+import os
 import uuid
-from langchain_openai import ChatOpenAI, OpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_cohere.rerank import CohereRerank
-from langchain import hub
+from langchain_openai import OpenAI
 from langchain_core.output_parsers import PydanticToolsParser, JsonOutputParser, StrOutputParser
 from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, SystemMessage, AIMessage, HumanMessage
@@ -17,21 +15,25 @@ from langgraph.constants import Send
 from langgraph.prebuilt import create_react_agent
 from searchflow import logger
 from searchflow.graphs.utils.state import OverallState, Intent, QuestionList, QuestionState, CitedSources
-from searchflow.db import DB
+from searchflow.db import get_db, get_async_db
 from searchflow.graphs.utils.prompts import Prompts
+from searchflow.llm.providers import get_chat_model, get_reranker, pull_prompt
 
 logger = logger.setup_logger(name="LangGraph", level="INFO")
-db = DB()
+
+# A chunk is a good enough local match, and skips the web search, with a vector score above 0.5
+# or a full-text score (ts_rank_cd, scaled to [0, 1)) of at least HYBRID_LEXICAL_THRESHOLD
+LEXICAL_THRESHOLD = float(os.getenv('HYBRID_LEXICAL_THRESHOLD', 0.2))
 
 def _setup_intent_detection():
-    prompt = hub.pull("vectrix/intent_detection")
-    llm = ChatAnthropic(model_name="claude-3-5-sonnet-20240620")
+    prompt = pull_prompt("vectrix/intent_detection")
+    llm = get_chat_model("anthropic", "claude-3-5-sonnet-20240620")
     llm_with_tools = llm.bind_tools(tools=[Intent])
     return prompt | llm_with_tools
 
 def _setup_question_detection():
-    prompt = hub.pull("vectrix/split_questions")
-    llm = ChatAnthropic(model_name="claude-3-5-sonnet-20240620")
+    prompt = pull_prompt("vectrix/split_questions")
+    llm = get_chat_model("anthropic", "claude-3-5-sonnet-20240620")
     llm_with_tools = llm.bind_tools(tools=[QuestionList])
     return prompt | llm_with_tools
 
@@ -47,27 +49,27 @@ def _filter_duplicate_docs(documents : List[Document]) -> List[Document]:
 
 
 def _rerank_docs(documents : Sequence[Document], question: str) -> Sequence[Document]:
-    reranker = CohereRerank(model="rerank-multilingual-v3.0")
+    reranker = get_reranker("rerank-multilingual-v3.0")
     reranked_docs = reranker.rerank(documents, query=question)
     print(reranked_docs)
     return reranked_docs
 
 def _rag_answer_chain():
-        llm = ChatAnthropic(model_name="claude-3-5-sonnet-20240620", temperature=0)
-        prompt_template = hub.pull("answer_question")
+        llm = get_chat_model("anthropic", "claude-3-5-sonnet-20240620", temperature=0)
+        prompt_template = pull_prompt("answer_question")
 
         return prompt_template | llm | StrOutputParser()
 
 def _setup_cite_sources_chain():
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        llm = get_chat_model("openai", "gpt-4o-mini", temperature=0)
         llm_with_tools = llm.bind_tools([CitedSources])
-        prompt = hub.pull("cite_sources")
+        prompt = pull_prompt("cite_sources")
         return prompt | llm_with_tools | PydanticToolsParser(tools=[CitedSources])
 
 def _setup_sql_agent_chain():
     llm = OpenAI(streaming=True)
-    db = DB()
-    db = SQLDatabase(engine=db.engine)
+    # Read-only connections with a statement timeout, so generated SQL cannot modify data or run unbounded
+    db = SQLDatabase(engine=get_db().readonly_engine)
     prompt_template = Prompts.sql_agent_prompt
 
     PROMPT = PromptTemplate(
@@ -75,14 +77,14 @@ def _setup_sql_agent_chain():
     )
 
 def _question_rewriter_chain():
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    prompt = hub.pull("vectrix/question_rewriter")
+    llm = get_chat_model("openai", "gpt-4o-mini", temperature=0)
+    prompt = pull_prompt("vectrix/question_rewriter")
     return prompt | llm | StrOutputParser()
 
 
 def _setup_hallucination_grader():
-    prompt = hub.pull("vectrix/hallucination_prompt")
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    prompt = pull_prompt("vectrix/hallucination_prompt")
+    llm = get_chat_model("openai", "gpt-4o-mini", temperature=0)
     return prompt | llm
 
 async def detect_intent(state :OverallState, config):
@@ -119,7 +121,7 @@ async def split_question_list(state: OverallState, config):
 
 async def llm_answer(state :OverallState, config):
     messages = state["messages"]
-    llm = ChatOpenAI(temperature=0, model="gpt-4o-mini")
+    llm = get_chat_model("openai", "gpt-4o-mini", temperature=0)
     response = await llm.ainvoke(messages)
     response = AIMessage(content=response.content)
     return {"messages": response}
@@ -136,7 +138,11 @@ async def retrieve(state: QuestionState, config):
     '''
     question = state['question']
     project_name = config.get('configurable', {}).get('project_name')
-    results = await db.asimilarity_search(question=question, project_name=project_name)
+    search_filter = config.get('configurable', {}).get('search_filter')
+    if config.get('configurable', {}).get('hybrid_search', True):
+        results = await get_async_db().hybrid_search(question=question, project_name=project_name, search_filter=search_filter)
+    else:
+        results = await get_async_db().similarity_search(question=question, project_name=project_name, search_filter=search_filter)
     documents = []
 
     # Add the second element of the tuple (score) to the document metadata
@@ -148,8 +154,11 @@ async def retrieve(state: QuestionState, config):
             except:
                 print(doc)
 
-    # Docs scored above 0.5 ? (boolean)
-    docs_above_threshold = [doc for doc in documents if doc.metadata.get('score', 0) > 0.5]
+    # Docs scored above 0.5, or matching the question's terms well enough ? (boolean)
+    docs_above_threshold = [
+        doc for doc in documents
+        if doc.metadata.get('score', 0) > 0.5 or (doc.metadata.get('lexical_score') or 0) >= LEXICAL_THRESHOLD
+    ]
 
     logger.info(f"Retrieved {len(documents)} documents from vector search")
 
@@ -282,10 +291,10 @@ async def sql_agent(state: OverallState, config):
             logger.error(f"Error in SQL agent: {e}")
 
 async def rewrite_last_message(state: OverallState, config):
-    prompt = hub.pull("rewrite_answer")
+    prompt = pull_prompt("rewrite_answer")
     question = state["messages"][-2].content
     answer = state["messages"][-1].content
-    llm = ChatOpenAI(temperature=0, model="gpt-4o")
+    llm = get_chat_model("openai", "gpt-4o", temperature=0)
     chain = prompt | llm
     rewritten_message = await chain.ainvoke({"question": question, "answer": answer})
     rewritten_message = AIMessage(rewritten_message.content)
@@ -2,6 +2,7 @@ import json
 from trafilatura import extract
 from langchain_core.documents import Document
 from searchflow import logger, DB
+from searchflow.db import hash_content
 from searchflow.extract import ExtractMetaData, ExtractionObject
 
 
@@ -20,6 +21,11 @@ class ChromeImporter:
         else:
             self.logging.error(f"Error processing HTML content: {content}")
             return
+
+        content_hash = hash_content(content['raw_text'])
+        if self.db.get_document_hashes(self.project_name, [url]).get(url) == content_hash:
+            self.logging.info(f"Skipping unchanged page: {url}")
+            return
         
         extraction_object = ExtractionObject(
             title=content['title'],
@@ -28,7 +34,8 @@ class ChromeImporter:
             project_name=self.project_name,
             file_type="webpage",
             source="chrome_extension",
-            filename=content['title']
+            filename=content['title'],
+            content_hash=content_hash
         )
 
         document = self.extractor.extract([extraction_object])
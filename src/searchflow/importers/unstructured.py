@@ -2,10 +2,10 @@ import os
 import re
 import uuid
 import json
-from typing import List
+from typing import List, Optional
 from langchain_core.documents import Document
 from searchflow import logger
-from searchflow.db import DB
+from searchflow.db import DB, get_db, hash_content
 from searchflow.extract.extraction import ExtractMetaData, ExtractionObject
 
 class Files:
@@ -15,9 +15,9 @@ class Files:
     manageable chunks suitable for efficient vector search operations.
     """
 
-    def __init__(self):
+    def __init__(self, db: Optional[DB] = None):
         self.logger = logger.setup_logger(name='Files', level="INFO")
-        self.db = DB()
+        self.db = db or get_db()
         self.extractor = ExtractMetaData()
 
 
@@ -54,14 +54,31 @@ class Files:
             from unstructured.chunking.basic import chunk_elements
             import io
 
+            # Skip files that were uploaded before with the same content, replace the ones that changed
+            changed_files = []
             for bytes_data, filename in document_data:
-                self.logger.info("Processing file %s of %s", idx, len(document_data))
-                
+                file_hash = hash_content(bytes_data)
+                existing_file = self.db.get_uploaded_file(project_name=project_name, filename=filename)
+                if existing_file:
+                    if existing_file["content_hash"] == file_hash:
+                        self.logger.info("Skipping unchanged file %s", filename)
+                        continue
+                    self.db.remove_file(project_name=project_name, file_name=filename)
+                changed_files.append((bytes_data, filename, file_hash))
+
+            # Upload the changed files concurrently, straight from memory
+            storage_urls = self.db.add_files(
+                project_name=project_name,
+                document_data=[(bytes_data, filename) for bytes_data, filename, _ in changed_files]
+            )
+
+            for (bytes_data, filename, file_hash), storage_url in zip(changed_files, storage_urls):
+                self.logger.info("Processing file %s of %s", idx, len(changed_files))
+                idx += 1
+                self.logger.info("Uploaded %s to object storage", filename)
+
                 # Create a temporary file-like object
                 file_obj = io.BytesIO(bytes_data)
-                
-                storage_url = self.db.add_file(document_data=(bytes_data, filename), project_name=project_name)
-                self.logger.info("Uploaded %s to object storage", filename)
 
                 file_type = os.path.splitext(filename)[1].replace(".", "")
 
@@ -82,7 +99,8 @@ class Files:
                             project_name=project_name,
                             file_type=file_type,
                             source="uploaded_file",
-                            filename=filename
+                            filename=filename,
+                            content_hash=file_hash
                         )
                         docs.append(doc)
                     docs = self.extractor.extract(docs)
@@ -90,8 +108,6 @@ class Files:
                         
                 except Exception as e:
                     self.logger.error("Error parsing file %s: %s", filename, e)
-                
-                idx += 1
 
         elif inference_type == "cloud":
             self.logger.info("Processing files using the unstructured API")
@@ -11,7 +11,7 @@ from trafilatura.downloads import add_to_compressed_dict, load_download_buffer,
 from langchain_core.documents import Document
 from langchain_community.document_loaders import SpiderLoader
 from searchflow import logger
-from searchflow.db import DB
+from searchflow.db import DB, hash_content
 from searchflow.extract.extraction import ExtractMetaData, ExtractionObject
 
 
@@ -78,24 +78,31 @@ class WebScraper:
         """
         return urlparse(url).netloc
     
-    def download_pages(self, urls: List[str], project_name: str):
+    def download_pages(self, urls: List[str], project_name: str, refresh: bool = False):
         """
         Downloads all pages from a URL and stores
+
+        Args:
+            urls (List[str]): The URLs to download
+            project_name (str): The name of the project
+            refresh (bool): Download pages that are already indexed again. Only pages whose content changed
+                since the last import are extracted and embedded again.
         """
-        already_downloaded = self.db.list_scraped_urls()
-        print(f"Already downloaded {len(already_downloaded)}")
+        if refresh:
+            to_download = urls
+        else:
+            already_downloaded = self.db.filter_indexed_urls(project_name, urls)
+            print(f"Already downloaded {len(already_downloaded)}")
 
-        if already_downloaded:
             to_download = [url for url in urls if url not in already_downloaded]
-        else:
-            to_download = urls
 
         print(f"To download {to_download}")
 
         to_download = add_to_compressed_dict(to_download)
 
         downloaded_objects = []
-        
+        missing_urls = []
+
 
         while to_download.done is False:
             bufferlist, url_store = load_download_buffer(url_store=to_download, sleep_time=0)
@@ -110,17 +117,26 @@ class WebScraper:
                         project_name=project_name,
                         file_type="webpage",
                         source="webpage",
+                        content_hash=hash_content(downloaded_page['raw_text'])
                     ))
                 else:
                     self.logger.error(f"No page found for {url}")
-                    self.db.remove_by_url(url=url, project_name=project_name)
-                    
-        downloaded_pages = self.extractor.extract(downloaded_objects)
+                    missing_urls.append(url)
+
+        if missing_urls:
+            # Also drop the metadata row and its content hash, so the page is downloaded and indexed again once it is back
+            self.db.remove_by_urls(project_name, missing_urls, include_metadata=True)
+
+        # Skip the pages that did not change since the last import
+        known_hashes = self.db.get_document_hashes(project_name, [obj.url for obj in downloaded_objects])
+        changed_objects = [obj for obj in downloaded_objects if known_hashes.get(obj.url) != obj.content_hash]
+        self.logger.info("%s of %s downloaded pages changed", len(changed_objects), len(downloaded_objects))
 
         try:
-            self.db.add_documents(downloaded_pages, project_name=project_name)
-            for url in urls:
-                self.db.update_indexed_link_status(url=url, project_name=project_name, status="Indexed")
+            if changed_objects:
+                downloaded_pages = self.extractor.extract(changed_objects)
+                self.db.add_documents(downloaded_pages, project_name=project_name)
+            self.db.update_indexed_link_statuses(urls, project_name=project_name, status="Indexed")
         except Exception as e:
             self.logger.error(f"Error adding documents: {e}")
             return False
@@ -0,0 +1,215 @@
+import re
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Type, Union
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.output_parsers.openai_tools import JsonOutputKeyToolsParser, PydanticToolsParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompts.structured import StructuredPrompt
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _message_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic chat model for offline runs and load tests. The same messages always get the same response,
+    after latency_ms milliseconds.
+
+    Plain calls answer with the first max_words words of the last message. With bound tools, or through
+    with_structured_output, it calls the first (or the chosen) tool with arguments generated from the tool schema:
+    strings repeat the last message, enums pick a value by hash of the messages, booleans are true and numbers zero.
+    field_values fixes the value of named fields, e.g. {"intent": "specific_question"}.
+    """
+    model_name: str = "fake"
+    latency_ms: float = 0
+    max_words: int = 64
+    field_values: Dict[str, Any] = Field(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "latency_ms": self.latency_ms}
+
+    def _value(self, schema: Dict[str, Any], name: str, text: str, seed: str) -> Any:
+        if name in self.field_values:
+            return self.field_values[name]
+        if "enum" in schema:
+            return schema["enum"][_digest(f"{name}|{seed}") % len(schema["enum"])]
+        for key in ("anyOf", "allOf", "oneOf"):
+            if schema.get(key):
+                return self._value(schema[key][0], name, text, seed)
+        schema_type = schema.get("type", "string")
+        if schema_type == "object":
+            return {key: self._value(value, key, text, seed) for key, value in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [self._value(schema.get("items", {}), name, text, seed)]
+        if schema_type == "boolean":
+            return True
+        if schema_type == "integer":
+            return 0
+        if schema_type == "number":
+            return 0.0
+        if schema_type == "null":
+            return None
+        return text
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict]] = None, tool_choice: Any = None) -> ChatResult:
+        text = " ".join(_message_text(messages[-1]).split()[:self.max_words]) if messages else ""
+        if not tools:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+        if isinstance(tool_choice, dict):
+            tool_choice = tool_choice.get("function", {}).get("name")
+        tool = next((t["function"] for t in tools if t["function"]["name"] == tool_choice), tools[0]["function"])
+        # Enum values depend on the whole conversation, so different questions take different paths
+        transcript = "\n".join(_message_text(message) for message in messages)
+        args = self._value({"type": "object", **tool.get("parameters", {})}, tool["name"], text, transcript)
+        message = AIMessage(
+            content="",
+            tool_calls=[{"name": tool["name"], "args": args, "id": f"call_{_digest(tool['name'] + transcript):016x}"}],
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any
+            ) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice"))
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any
+            ) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice"))
+
+    def bind_tools(self, tools: Sequence[Union[Dict[str, Any], Type[BaseModel], Any]], *, tool_choice: Optional[str] = None, **kwargs: Any) -> Runnable:
+        formatted = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice:
+            kwargs["tool_choice"] = tool_choice
+        return super().bind(tools=formatted, **kwargs)
+
+    def with_structured_output(self, schema: Union[Dict, Type[BaseModel]], *, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        name = convert_to_openai_tool(schema)["function"]["name"]
+        llm = self.bind_tools([schema], tool_choice=name)
+        if isinstance(schema, type):
+            return llm | PydanticToolsParser(tools=[schema], first_tool_only=True)
+        return llm | JsonOutputKeyToolsParser(key_name=name, first_tool_only=True)
+
+
+class LexicalReranker:
+    """
+    Offline stand-in for CohereRerank: scores every document by the share of the query terms it contains.
+    Returns the same shape as CohereRerank.rerank, a list of {"index", "relevance_score"} by descending score.
+    """
+    _token_pattern = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, top_n: int = 3):
+        self.top_n = top_n
+
+    def rerank(self, documents: Sequence[Union[str, Document, Dict[str, Any]]], query: str, top_n: Optional[int] = -1) -> List[Dict[str, Any]]:
+        terms = set(self._token_pattern.findall(query.lower()))
+        top_n = self.top_n if top_n == -1 else top_n
+        results = []
+        for index, doc in enumerate(documents):
+            content = doc.page_content if isinstance(doc, Document) else doc.get("text", "") if isinstance(doc, dict) else doc
+            words = set(self._token_pattern.findall(content.lower()))
+            score = len(terms & words) / len(terms) if terms else 0.0
+            results.append({"index": index, "relevance_score": score})
+        results.sort(key=lambda result: result["relevance_score"], reverse=True)
+        return results[:top_n] if top_n else results
+
+
+def _object_schema(title: str, description: str, **properties: Dict[str, Any]) -> Dict[str, Any]:
+    return {"title": title, "description": description, "type": "object", "properties": properties, "required": list(properties)}
+
+
+# Local versions of the LangChain Hub prompts, with the same input variables and output shape
+LOCAL_PROMPTS = {
+    "vectrix/intent_detection": lambda: StructuredPrompt(
+        [
+            ("system", "Classify the intent of the last question of the user."),
+            MessagesPlaceholder("chat_history"),
+            ("human", "{question}"),
+        ],
+        _object_schema(
+            "Intent", "The intent of the question",
+            intent={"type": "string", "enum": ["greeting", "specific_question", "metadata_query", "follow_up_question"]},
+        ),
+    ),
+    "vectrix/split_questions": lambda: StructuredPrompt(
+        [
+            ("system", "Split the question into independent questions."),
+            ("human", "{QUESTION}"),
+        ],
+        _object_schema("QuestionList", "The questions", questions={"type": "array", "items": {"type": "string"}}),
+    ),
+    "answer_question": lambda: ChatPromptTemplate.from_messages([
+        ("system", "Answer the question using the sources.\n\n{SOURCES}"),
+        ("human", "{QUESTION}"),
+    ]),
+    "cite_sources": lambda: ChatPromptTemplate.from_messages([
+        ("system", "Cite the sources used to answer the question.\n\n{SOURCES}"),
+        ("human", "{QUESTION}"),
+    ]),
+    "vectrix/question_rewriter": lambda: ChatPromptTemplate.from_messages([
+        ("system", "Rewrite the question so it is better suited for retrieval."),
+        ("human", "{question}"),
+    ]),
+    "vectrix/hallucination_prompt": lambda: StructuredPrompt(
+        [
+            ("system", "Grade whether the answer is grounded in the documents.\n\n{documents}"),
+            ("human", "{generation}"),
+        ],
+        _object_schema(
+            "GradeHallucinations", "Whether the answer is grounded in the documents",
+            binary_score={"type": "boolean"},
+        ),
+    ),
+    "rewrite_answer": lambda: ChatPromptTemplate.from_messages([
+        ("system", "Rewrite the answer to the question in plain language.\n\nQuestion: {question}"),
+        ("human", "{answer}"),
+    ]),
+    "entity_extraction": lambda: StructuredPrompt(
+        [
+            ("system", "Extract the metadata of the document."),
+            ("human", "{content}"),
+        ],
+        _object_schema(
+            "DocumentMetadata", "The metadata of the document",
+            author={"type": "string"},
+            language={"type": "string"},
+            content_type={"type": "string"},
+            tags={"type": "array", "items": {"type": "string"}},
+            summary={"type": "string"},
+        ),
+    ),
+}
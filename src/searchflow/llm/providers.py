@@ -0,0 +1,75 @@
+import os
+import json
+from functools import lru_cache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.prompts import BasePromptTemplate
+from searchflow.llm.offline import FakeChatModel, LexicalReranker, LOCAL_PROMPTS
+
+VALID_LLM_PROVIDERS = ['hosted', 'fake']
+
+
+def llm_provider() -> str:
+    '''
+    The provider of the chat models, rerankers and prompts, from LLM_PROVIDER:
+    "hosted" (default) uses Anthropic, OpenAI, Cohere and LangChain Hub, "fake" runs everything locally.
+    '''
+    provider = os.getenv('LLM_PROVIDER', 'hosted').lower()
+    if provider not in VALID_LLM_PROVIDERS:
+        raise ValueError(f"Invalid LLM provider: {provider}. Valid providers are {VALID_LLM_PROVIDERS}")
+    return provider
+
+
+def get_chat_model(vendor: str, model: str, **kwargs) -> BaseChatModel:
+    '''
+    Return the chat model of a vendor ("anthropic" or "openai"), or a FakeChatModel when LLM_PROVIDER is "fake".
+    The vendor packages are imported on first use, so offline runs do not need them installed.
+
+    The fake model answers after LLM_FAKE_LATENCY_MS milliseconds. LLM_FAKE_FIELDS is a JSON object that fixes
+    fields of its structured outputs, e.g. '{"intent": "specific_question"}' sends every question through retrieval.
+
+    Args:
+        vendor (str): "anthropic" or "openai".
+        model (str): The model name.
+        kwargs: Passed to the model, e.g. temperature.
+    '''
+    if llm_provider() == 'fake':
+        return FakeChatModel(
+            model_name=model,
+            latency_ms=float(os.getenv('LLM_FAKE_LATENCY_MS', 0)),
+            field_values=json.loads(os.getenv('LLM_FAKE_FIELDS', '{}')),
+        )
+    if vendor == 'anthropic':
+        from langchain_anthropic import ChatAnthropic
+        return ChatAnthropic(model_name=model, **kwargs)
+    if vendor == 'openai':
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, **kwargs)
+    raise ValueError(f"Invalid chat model vendor: {vendor}. Valid vendors are ['anthropic', 'openai']")
+
+
+def get_reranker(model: str = "rerank-multilingual-v3.0"):
+    '''
+    Return the Cohere reranker, or a LexicalReranker when LLM_PROVIDER is "fake".
+    '''
+    if llm_provider() == 'fake':
+        return LexicalReranker()
+    from langchain_cohere.rerank import CohereRerank
+    return CohereRerank(model=model)
+
+
+@lru_cache(maxsize=None)
+def _local_prompt(name: str) -> BasePromptTemplate:
+    if name not in LOCAL_PROMPTS:
+        raise ValueError(f"No local version of prompt: {name}. Local prompts are {list(LOCAL_PROMPTS)}")
+    return LOCAL_PROMPTS[name]()
+
+
+def pull_prompt(name: str) -> BasePromptTemplate:
+    '''
+    Pull a prompt from LangChain Hub. When LLM_PROVIDER is "fake", or PROMPT_SOURCE is "local",
+    the local version of the prompt is returned instead, with the same inputs and output shape.
+    '''
+    if llm_provider() == 'fake' or os.getenv('PROMPT_SOURCE', 'hub').lower() == 'local':
+        return _local_prompt(name)
+    from langchain import hub
+    return hub.pull(name)
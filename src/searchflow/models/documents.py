@@ -20,4 +20,5 @@ class DocumentMetaData(BaseModel):
     read_time: float
     creation_date: Optional[datetime] = None
     last_modified_date: Optional[datetime] = None
-    upload_date: datetime = Field(default_factory=lambda: datetime.now(UTC))
\ No newline at end of file
+    upload_date: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    content_hash: Optional[str] = None
\ No newline at end of file
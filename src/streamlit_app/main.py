@@ -1,7 +1,7 @@
 from dotenv import load_dotenv
 load_dotenv()
 import streamlit as st
-from searchflow.db import DB
+from searchflow.db import get_db
 from searchflow import logger
 
 from importlib.metadata import version, PackageNotFoundError
@@ -12,7 +12,7 @@ if "project" not in st.session_state:
     st.session_state.project = ''
 
 if "db" not in st.session_state:
-    st.session_state.db = DB()
+    st.session_state.db = get_db()
 
 if "projects" not in st.session_state:
     st.session_state.projects = st.session_state.db.list_projects()
@@ -2,6 +2,9 @@ import streamlit as st
 
 options = st.session_state.db.list_projects()
 
+if "teardowns" not in st.session_state:
+    st.session_state.teardowns = {}
+
 st.title("Manage Projects")
 
 @st.dialog('Add project')
@@ -18,10 +21,15 @@ def remove_project_data():
     st.write("Remove the project and all the linked data")
     project = st.selectbox("Select project", st.session_state.projects)
     if st.button('Yes, remove the project and all data', type="primary"):
-        st.session_state.db.remove_project(project)
-        st.session_state.projects = st.session_state.db.list_projects()
+        # The teardown runs in the background, its progress is shown on the page below
+        progress = {}
+        future = st.session_state.db.remove_project(
+            project, background=True, progress=lambda stage, done, total: progress.update(stage=stage, done=done, total=total)
+        )
+        st.session_state.teardowns[project] = (future, progress)
+        st.session_state.projects = [name for name in st.session_state.projects if name != project]
         try:
-            st.session_state.project = st.session_state.db.list_projects()[0]
+            st.session_state.project = st.session_state.projects[0]
         except IndexError:
             st.session_state.project = None
         st.rerun()
@@ -38,3 +46,18 @@ with col2:
         if st.button("Remove project", type="primary", use_container_width=True):
             remove_project_data()
 
+for name, (future, progress) in list(st.session_state.teardowns.items()):
+    if future.done():
+        del st.session_state.teardowns[name]
+        if future.result():
+            st.success(f"Removed project {name}")
+        else:
+            st.error(f"Unable to remove project {name}")
+        st.session_state.projects = st.session_state.db.list_projects()
+    elif progress:
+        st.progress(progress["done"] / max(progress["total"], 1), text=f"Removing {name}: {progress['stage']} {progress['done']}/{progress['total']}")
+    else:
+        st.progress(0, text=f"Removing {name}")
+
+if st.session_state.teardowns and st.button("Refresh progress"):
+    st.rerun()
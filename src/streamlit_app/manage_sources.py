@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
 
-# Database connection
-SOURCES_DF = pd.DataFrame(st.session_state.db.get_collection_metdata(st.session_state.project)).drop_duplicates()
+PAGE_SIZE = 100
+
+# Statistics are aggregated in the database, the documents are fetched one page at a time
+STATISTICS = st.session_state.db.get_collection_statistics(st.session_state.project)
+
+if st.session_state.get("sources_project") != st.session_state.project:
+    st.session_state.sources_project = st.session_state.project
+    st.session_state.sources_cursors = [None]
 
 st.title("Sources")
 
@@ -12,15 +18,27 @@ st.title("Sources")
 
 st.subheader("Indexed Data")
 
-if len(SOURCES_DF) == 0:
+if STATISTICS["documents"] == 0:
     st.warning("No sources indexed yet.")
 else:
     st.subheader("Statistics 📊")
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total Documents", len(SOURCES_DF))
-    col2.metric("Total Sources", SOURCES_DF['source'].nunique())
-    col3.metric("Amount of formats", SOURCES_DF['file_type'].nunique())
-    st.dataframe(SOURCES_DF, 
+    col1.metric("Total Documents", STATISTICS["documents"])
+    col2.metric("Total Sources", STATISTICS["sources"])
+    col3.metric("Amount of formats", STATISTICS["formats"])
+
+    cursors = st.session_state.sources_cursors
+    documents = st.session_state.db.list_documents(st.session_state.project, limit=PAGE_SIZE, after_id=cursors[-1])
+    st.dataframe(pd.DataFrame(documents, columns=["title", "source", "file_type", "url"]),
                 column_config={
                             "url" : st.column_config.LinkColumn(),
                         })
+
+    col1, col2, col3 = st.columns(3)
+    col2.text(f"Page {len(cursors)} of {-(-STATISTICS['documents'] // PAGE_SIZE)}")
+    if col1.button("Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col3.button("Next page", disabled=len(documents) < PAGE_SIZE):
+        cursors.append(documents[-1]["id"])
+        st.rerun()
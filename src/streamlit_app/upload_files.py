@@ -50,6 +50,13 @@ if uploaded_files:
         },
         use_container_width=True
         )
+    # Files without a download URL (STORAGE_BACKEND=local) are downloaded through the app
+    files_to_download = df[df["signed_download_url"].isna()]["filename"]
+    if not files_to_download.empty:
+        file_to_download = st.selectbox("Select a file to download", files_to_download)
+        file_data = st.session_state.db.read_file(st.session_state.project, file_to_download)
+        if file_data is not None:
+            st.download_button("Download File", data=bytes(file_data), file_name=file_to_download)
     file_to_remove = st.selectbox("Select a file to remove", df['filename'])
     if st.button('Remove File', type='primary'):
         if file_to_remove:
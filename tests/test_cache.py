@@ -0,0 +1,71 @@
+import time
+
+from searchflow.db.cache import TTLCache
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    forever = TTLCache(maxsize=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    forever.set("c", 3)
+
+    now[0] += 30
+    assert cache.get("a") == 1
+    assert cache.get("b", "expired") == "expired"
+
+    now[0] += 31
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert forever.get("c") == 3
+
+
+def test_hit_and_miss_counters():
+    cache = TTLCache(maxsize=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_falsy_values_are_cached():
+    cache = TTLCache(maxsize=10)
+    cache.set("empty", [])
+    cache.set("zero", 0)
+
+    assert cache.get("empty", "missing") == []
+    assert cache.get("zero", "missing") == 0
+
+
+def test_pop_clear_and_disabled_cache():
+    cache = TTLCache(maxsize=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "gone") == "gone"
+    cache.clear()
+    assert cache.get("b") is None
+
+    disabled = TTLCache(maxsize=0)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+    assert len(disabled) == 0
@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+from langchain_core.documents import Document
+
+from searchflow.db.chunking import chunk_content, chunk_id, chunking_tokenizer
+
+
+def _documents():
+    text = " ".join(f"Sentence number {i} of the handbook." for i in range(200))
+    return [
+        Document(page_content=text, metadata={"project_name": "docs", "url": "https://example.com/a"}),
+        Document(page_content="A short page.", metadata={"project_name": "docs", "url": "https://example.com/b"}),
+    ]
+
+
+def test_chunk_id_is_deterministic():
+    first = chunk_id("docs", "https://example.com/a", 0, "Some content")
+
+    assert first == chunk_id("docs", "https://example.com/a", 0, "Some content")
+    assert uuid.UUID(first).version == 5
+
+
+@pytest.mark.parametrize("project_name, url, position, content", [
+    ("other", "https://example.com/a", 0, "Some content"),
+    ("docs", "https://example.com/b", 0, "Some content"),
+    ("docs", "https://example.com/a", 1, "Some content"),
+    ("docs", "https://example.com/a", 0, "Other content"),
+])
+def test_chunk_id_depends_on_every_part(project_name, url, position, content):
+    assert chunk_id(project_name, url, position, content) != chunk_id("docs", "https://example.com/a", 0, "Some content")
+
+
+def test_chunk_content_ids_are_stable_across_runs():
+    first = chunk_content(_documents(), chunk_size=100, tokenizer="characters", parallel=False)
+    second = chunk_content(_documents(), chunk_size=100, tokenizer="characters", parallel=False)
+
+    assert len(first) > 2
+    assert [chunk.metadata["uuid"] for chunk in first] == [chunk.metadata["uuid"] for chunk in second]
+    assert len({chunk.metadata["uuid"] for chunk in first}) == len(first)
+    assert first[-1].metadata == {
+        "project_name": "docs",
+        "url": "https://example.com/b",
+        "uuid": chunk_id("docs", "https://example.com/b", 0, "A short page."),
+    }
+
+
+def test_chunking_tokenizer(monkeypatch):
+    monkeypatch.delenv("CHUNKING_TOKENIZER", raising=False)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
+    assert chunking_tokenizer() == "characters"
+
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "cohere")
+    assert chunking_tokenizer() == "tiktoken"
+
+    monkeypatch.setenv("CHUNKING_TOKENIZER", "words")
+    with pytest.raises(ValueError):
+        chunking_tokenizer()
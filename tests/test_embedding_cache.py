@@ -0,0 +1,148 @@
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.dialects import postgresql
+
+from searchflow.db.embeddings import CachedEmbeddings, embedding_key
+
+
+class CountingEmbeddings(Embeddings):
+    '''
+    Embeds every text as [len(text)] and records the texts sent to the provider
+    '''
+    def __init__(self):
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text))]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+class Row:
+    def __init__(self, content_hash, embedding):
+        self.content_hash = content_hash
+        self.embedding = embedding
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *conditions):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSessionFactory:
+    '''
+    Stands in for the embedding_cache table: query() returns every stored row, execute() stores the inserted rows
+    '''
+    def __init__(self, fail_reads=False):
+        self.rows = {}
+        self.fail_reads = fail_reads
+        self.reads = 0
+
+    def __call__(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, factory):
+        self.factory = factory
+
+    def query(self, *columns):
+        self.factory.reads += 1
+        if self.factory.fail_reads:
+            raise ConnectionError("database unavailable")
+        return FakeQuery([Row(key, vector) for key, vector in self.factory.rows.items()])
+
+    def execute(self, statement):
+        params = statement.compile(dialect=postgresql.dialect()).params
+        for name, value in params.items():
+            if name.startswith("content_hash"):
+                self.factory.rows[value] = params[name.replace("content_hash", "embedding")]
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_repeated_texts_are_embedded_once():
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, model="test", session_factory=FakeSessionFactory())
+
+    vectors = embeddings.embed_documents(["a", "bb", "a", "ccc", "bb"])
+
+    assert vectors == [[1.0], [2.0], [1.0], [3.0], [2.0]]
+    assert provider.documents == [["a", "bb", "ccc"]]
+    assert embeddings.stats()["misses"] == 3
+
+
+def test_hits_come_from_the_lru_then_the_database():
+    sessions = FakeSessionFactory()
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, model="test", session_factory=sessions)
+    embeddings.embed_documents(["a", "bb"])
+    assert set(sessions.rows) == {embedding_key("a"), embedding_key("bb")}
+
+    # Served from the in-process LRU, the database is not read
+    reads = sessions.reads
+    assert embeddings.embed_documents(["bb", "a"]) == [[2.0], [1.0]]
+    assert sessions.reads == reads
+
+    # Another process has an empty LRU and reads the database
+    other = CachedEmbeddings(CountingEmbeddings(), model="test", session_factory=sessions)
+    assert other.embed_documents(["a", "dddd"]) == [[1.0], [4.0]]
+    assert other.embeddings.documents == [["dddd"]]
+
+    assert embeddings.stats() == {
+        "model": "test", "lru_hits": 2, "db_hits": 0, "misses": 2, "hit_rate": 0.5, "query_hits": 0, "query_misses": 0,
+    }
+    assert other.stats()["db_hits"] == 1
+    assert other.stats()["misses"] == 1
+    assert provider.documents == [["a", "bb"]]
+
+
+def test_disabled_lru_reads_the_database():
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, model="test", session_factory=FakeSessionFactory(), lru_size=0)
+    embeddings.embed_documents(["a"])
+    embeddings.embed_documents(["a"])
+
+    assert provider.documents == [["a"]]
+    assert embeddings.stats()["lru_hits"] == 0
+    assert embeddings.stats()["db_hits"] == 1
+
+
+def test_database_errors_fall_back_to_the_provider():
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, model="test", session_factory=FakeSessionFactory(fail_reads=True))
+
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0], [2.0]]
+    assert provider.documents == [["a", "bb"]]
+    assert embeddings.stats()["misses"] == 2
+
+
+def test_query_embeddings_are_cached_by_normalized_text():
+    provider = CountingEmbeddings()
+    embeddings = CachedEmbeddings(provider, model="test", session_factory=FakeSessionFactory())
+
+    assert embeddings.embed_query("what  is\nthis") == [12.0]
+    assert asyncio.run(embeddings.aembed_query(" what is this ")) == [12.0]
+    assert provider.queries == ["what is this"]
+    assert embeddings.stats()["query_hits"] == 1
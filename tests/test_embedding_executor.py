@@ -0,0 +1,71 @@
+import time
+import threading
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from searchflow.db.embeddings import EmbeddingExecutor
+
+
+class SlowFirstBatchEmbeddings(Embeddings):
+    '''
+    Embeds "t<i>" as [i]. The batch holding t0 is slow, so batches complete out of order
+    '''
+    def __init__(self, error_on=None):
+        self.error_on = error_on
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.threads.add(threading.current_thread().name)
+        if "t0" in texts:
+            time.sleep(0.2)
+        if self.error_on in texts:
+            raise RuntimeError(f"cannot embed {self.error_on}")
+        return [[float(text[1:])] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _collect(executor, texts):
+    vectors = [None] * len(texts)
+    offsets = []
+    for offset, batch in executor.map(texts):
+        offsets.append(offset)
+        vectors[offset:offset + len(batch)] = batch
+    return offsets, vectors
+
+
+def test_batches_are_yielded_as_they_complete_with_their_offset():
+    texts = [f"t{i}" for i in range(10)]
+    provider = SlowFirstBatchEmbeddings()
+
+    offsets, vectors = _collect(EmbeddingExecutor(provider, batch_size=3, max_workers=4), texts)
+
+    assert vectors == [[float(i)] for i in range(10)]
+    assert sorted(offsets) == [0, 3, 6, 9]
+    # The slow first batch completes last
+    assert offsets[-1] == 0
+    assert all(name.startswith("embed") for name in provider.threads)
+
+
+def test_single_batches_and_one_worker_run_in_the_caller_thread():
+    texts = [f"t{i}" for i in range(5)]
+
+    for executor in (EmbeddingExecutor(SlowFirstBatchEmbeddings(), batch_size=10), EmbeddingExecutor(SlowFirstBatchEmbeddings(), batch_size=2, max_workers=1)):
+        offsets, vectors = _collect(executor, texts)
+        assert vectors == [[float(i)] for i in range(5)]
+        assert offsets == sorted(offsets)
+        assert executor.embeddings.threads == {threading.current_thread().name}
+
+    assert list(EmbeddingExecutor(SlowFirstBatchEmbeddings()).map([])) == []
+
+
+def test_batch_errors_are_raised_to_the_caller():
+    texts = [f"t{i}" for i in range(10)]
+    executor = EmbeddingExecutor(SlowFirstBatchEmbeddings(error_on="t7"), batch_size=3, max_workers=4)
+
+    with pytest.raises(RuntimeError, match="cannot embed t7"):
+        _collect(executor, texts)
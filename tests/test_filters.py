@@ -0,0 +1,43 @@
+import json
+from datetime import datetime, timezone, timedelta
+
+from searchflow.db.filters import SearchFilter
+
+
+def test_empty_filter_compiles_to_nothing():
+    assert SearchFilter().compile() == ("", {})
+    assert SearchFilter(tags=[], language=None).compile() == ("", {})
+
+
+def test_metadata_fields_match_any_value():
+    sql, params = SearchFilter(file_type=["pdf", "docx"], tags=["hr"]).compile(alias="c")
+
+    assert sql == (
+        " AND (c.cmetadata @> CAST(:f_file_type_0 AS jsonb) OR c.cmetadata @> CAST(:f_file_type_1 AS jsonb))"
+        " AND (c.cmetadata @> CAST(:f_tags_0 AS jsonb))"
+    )
+    assert json.loads(params["f_file_type_0"]) == {"file_type": "pdf"}
+    assert json.loads(params["f_file_type_1"]) == {"file_type": "docx"}
+    # Tags are a list in the metadata, so containment needs a list too
+    assert json.loads(params["f_tags_0"]) == {"tags": ["hr"]}
+
+
+def test_date_fields_filter_on_the_document():
+    created_after = datetime(2024, 1, 1)
+    uploaded_before = datetime(2024, 6, 1, tzinfo=timezone(timedelta(hours=2)))
+    sql, params = SearchFilter(created_after=created_after, uploaded_before=uploaded_before).compile()
+
+    assert sql == (
+        " AND EXISTS (SELECT 1 FROM document_metadata AS d WHERE d.id = e.document_id AND "
+        "d.creation_date >= :f_created_after AND d.upload_date < :f_uploaded_before)"
+    )
+    # Naive datetimes are taken as UTC, aware ones are kept
+    assert params["f_created_after"] == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert params["f_uploaded_before"] is uploaded_before
+
+
+def test_metadata_and_date_conditions_are_combined():
+    sql, params = SearchFilter(language=["en"], created_before=datetime(2024, 1, 1)).compile()
+
+    assert sql.startswith(" AND (e.cmetadata @> CAST(:f_language_0 AS jsonb)) AND EXISTS (")
+    assert set(params) == {"f_language_0", "f_created_before"}
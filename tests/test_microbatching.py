@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from searchflow.db.embeddings import MicroBatchingEmbeddings
+
+
+class RecordingEmbeddings(Embeddings):
+    '''
+    Embeds "r<request>-<position>" as [request, position] and records the size of every provider call
+    '''
+    def __init__(self, error: Exception = None):
+        self.calls = []
+        self.error = error
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(len(texts))
+        if self.error:
+            raise self.error
+        return [[float(part) for part in text[1:].split("-")] for text in texts]
+
+    def embed_query(self, text):
+        with self._lock:
+            self.calls.append(1)
+        return [0.0, 0.0]
+
+
+def _requests(count):
+    return [[f"r{i}-{j}" for j in range(1 + i % 4)] for i in range(count)]
+
+
+def _embed_concurrently(embeddings, requests):
+    barrier = threading.Barrier(len(requests))
+
+    def embed(texts):
+        barrier.wait()
+        return embeddings.embed_documents(texts)
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        return list(executor.map(embed, requests))
+
+
+def test_concurrent_requests_share_provider_calls():
+    provider = RecordingEmbeddings()
+    embeddings = MicroBatchingEmbeddings(provider, max_batch_size=16, max_wait_ms=200)
+    requests = _requests(20)
+
+    results = _embed_concurrently(embeddings, requests)
+
+    # Every caller gets the vectors of its own texts, in the order of its texts
+    for texts, vectors in zip(requests, results):
+        assert vectors == [[float(part) for part in text[1:].split("-")] for text in texts]
+    assert len(provider.calls) < len(requests)
+    assert sum(provider.calls) == sum(len(texts) for texts in requests)
+    assert max(provider.calls) <= 16
+    assert embeddings.requests == len(requests)
+
+
+def test_full_batches_and_queries_go_to_the_provider_directly():
+    provider = RecordingEmbeddings()
+    embeddings = MicroBatchingEmbeddings(provider, max_batch_size=4, max_wait_ms=200)
+
+    assert embeddings.embed_documents(["r1-0", "r1-1", "r1-2", "r1-3"]) == [[1.0, 0.0], [1.0, 1.0], [1.0, 2.0], [1.0, 3.0]]
+    assert embeddings.embed_query("question") == [0.0, 0.0]
+    assert embeddings.embed_documents([]) == []
+    assert provider.calls == [4, 1]
+    assert embeddings.batches == 0
+
+
+def test_provider_errors_reach_every_caller():
+    provider = RecordingEmbeddings(error=RuntimeError("provider down"))
+    embeddings = MicroBatchingEmbeddings(provider, max_batch_size=64, max_wait_ms=200)
+    requests = _requests(8)
+    barrier = threading.Barrier(len(requests))
+
+    def embed(texts):
+        barrier.wait()
+        with pytest.raises(RuntimeError, match="provider down"):
+            embeddings.embed_documents(texts)
+        return True
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        assert all(executor.map(embed, requests))
+    assert len(provider.calls) < len(requests)
@@ -0,0 +1,98 @@
+import math
+import asyncio
+from typing import List
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.pydantic_v1 import BaseModel, Field
+
+from searchflow.db.embeddings import HashingEmbeddings
+from searchflow.llm.offline import LOCAL_PROMPTS, FakeChatModel
+
+
+class Intent(BaseModel):
+    """The intent of the question"""
+    intent: str = Field(description="The intent", enum=["greeting", "specific_question"])
+    follow_up: bool
+    confidence: float
+    questions: List[str]
+
+
+GRADE_SCHEMA = {
+    "title": "GradeHallucinations",
+    "description": "Whether the answer is grounded in the documents",
+    "type": "object",
+    "properties": {"binary_score": {"type": "boolean"}, "reason": {"type": "string"}},
+    "required": ["binary_score", "reason"],
+}
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_hashing_embeddings_are_normalized_and_deterministic():
+    embeddings = HashingEmbeddings(dimensions=64)
+    vectors = embeddings.embed_documents(["The quick brown fox", "", "!!!"])
+
+    assert [len(vector) for vector in vectors] == [64, 64, 64]
+    for vector in vectors:
+        assert math.isclose(math.sqrt(sum(value * value for value in vector)), 1.0)
+    # A new instance gives the same vectors, so stored embeddings stay valid across processes
+    assert HashingEmbeddings(dimensions=64).embed_documents(["The quick brown fox"])[0] == vectors[0]
+    assert embeddings.embed_query("the QUICK brown fox") == vectors[0]
+    assert asyncio.run(embeddings.aembed_query("The quick brown fox")) == vectors[0]
+
+
+def test_hashing_embeddings_similarity_follows_shared_terms():
+    embeddings = HashingEmbeddings()
+    query, related, unrelated = embeddings.embed_documents([
+        "vacation policy for employees",
+        "the vacation policy gives employees 25 days",
+        "invoice numbers and shipping addresses",
+    ])
+
+    assert _cosine(query, related) > _cosine(query, unrelated)
+    assert _cosine(query, related) > 0.3
+
+
+def test_fake_chat_model_plain_answers():
+    model = FakeChatModel(max_words=3)
+
+    assert model.invoke("one two three four").content == "one two three"
+    assert model.invoke([HumanMessage(content="same question")]).content == model.invoke("same question").content
+
+
+def test_structured_output_with_a_pydantic_schema():
+    model = FakeChatModel()
+    result = model.with_structured_output(Intent).invoke("What is the vacation policy?")
+
+    assert isinstance(result, Intent)
+    assert result.intent in ("greeting", "specific_question")
+    assert result.follow_up is True
+    assert result.confidence == 0.0
+    assert result.questions == ["What is the vacation policy?"]
+    # The same conversation always takes the same path
+    assert model.with_structured_output(Intent).invoke("What is the vacation policy?") == result
+
+
+def test_structured_output_with_a_dict_schema_and_field_values():
+    model = FakeChatModel(field_values={"reason": "grounded"})
+    result = asyncio.run(model.with_structured_output(GRADE_SCHEMA).ainvoke("An answer"))
+
+    assert result == {"binary_score": True, "reason": "grounded"}
+
+
+def test_bound_tools_produce_tool_calls():
+    model = FakeChatModel().bind_tools([Intent, GRADE_SCHEMA], tool_choice="GradeHallucinations")
+    message = model.invoke("An answer")
+
+    assert isinstance(message, AIMessage)
+    assert [call["name"] for call in message.tool_calls] == ["GradeHallucinations"]
+    assert message.tool_calls[0]["args"]["binary_score"] is True
+
+
+def test_local_structured_prompts_run_against_the_fake_model():
+    model = FakeChatModel(field_values={"intent": "specific_question"})
+    chain = LOCAL_PROMPTS["vectrix/intent_detection"]() | model
+
+    assert chain.invoke({"chat_history": [], "question": "How many vacation days?"}) == {"intent": "specific_question"}
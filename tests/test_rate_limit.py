@@ -0,0 +1,137 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from searchflow.db import embeddings as embeddings_module
+from searchflow.db.embeddings import RateLimitedEmbeddings, TokenBucket, is_rate_limited, retry_after
+
+
+class RateLimitError(Exception):
+    def __init__(self, status_code=429, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TooManyRequestsError(Exception):
+    pass
+
+
+class FlakyEmbeddings(Embeddings):
+    '''
+    Raises the given errors on the first calls, then embeds every text as [1.0]
+    '''
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[1.0] for _ in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waits = []
+    monkeypatch.setattr(embeddings_module.time, "sleep", waits.append)
+    return waits
+
+
+def test_token_bucket_allows_a_burst_then_spaces_out_calls():
+    bucket = TokenBucket(rate_per_minute=600, burst=3)
+
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+    # 600 per minute is one token every 100ms once the burst is used
+    bucket.acquire(2)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_token_bucket_defaults_and_disabled_limit():
+    assert TokenBucket(rate_per_minute=6000).capacity == 100
+    assert TokenBucket(rate_per_minute=30).capacity == 1
+
+    bucket = TokenBucket(rate_per_minute=0)
+    start = time.monotonic()
+    for _ in range(1000):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+
+def test_is_rate_limited():
+    class Response:
+        status_code = 429
+
+    class ResponseError(Exception):
+        response = Response()
+
+    assert is_rate_limited(RateLimitError())
+    assert is_rate_limited(ResponseError())
+    assert is_rate_limited(TooManyRequestsError())
+    assert not is_rate_limited(RateLimitError(status_code=500))
+    assert not is_rate_limited(ValueError("bad input"))
+
+
+def test_rate_limited_calls_are_retried_with_backoff(sleeps):
+    provider = FlakyEmbeddings(RateLimitError(), TooManyRequestsError())
+    embeddings = RateLimitedEmbeddings(provider, requests_per_minute=0, backoff=0.5)
+
+    assert embeddings.embed_documents(["a", "b"]) == [[1.0], [1.0]]
+    assert provider.calls == 3
+    assert len(sleeps) == 2
+    assert 0.5 <= sleeps[0] < 1.0
+    assert 1.0 <= sleeps[1] < 2.0
+
+
+def test_retry_after_header_is_honoured(sleeps):
+    provider = FlakyEmbeddings(RateLimitError(headers={"retry-after": "7"}))
+    embeddings = RateLimitedEmbeddings(provider, requests_per_minute=0)
+
+    assert embeddings.embed_query("a") == [1.0]
+    assert sleeps == [7.0]
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+
+    assert retry_after(RateLimitError(headers={"retry-after": "2.5"})) == 2.5
+    assert 55 < retry_after(RateLimitError(headers={"Retry-After": in_a_minute})) <= 60
+    assert retry_after(RateLimitError(headers={"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after(RateLimitError(headers={"retry-after": "soon"})) is None
+    assert retry_after(RateLimitError(headers={"retry-after": "inf"})) is None
+    assert retry_after(RateLimitError()) is None
+
+
+def test_unparseable_retry_after_falls_back_to_backoff(sleeps):
+    provider = FlakyEmbeddings(RateLimitError(headers={"retry-after": "soon"}))
+    embeddings = RateLimitedEmbeddings(provider, requests_per_minute=0, backoff=0.5)
+
+    assert embeddings.embed_query("a") == [1.0]
+    assert len(sleeps) == 1 and 0.5 <= sleeps[0] < 1.0
+
+
+def test_other_errors_and_exhausted_retries_are_raised(sleeps):
+    provider = FlakyEmbeddings(RateLimitError(status_code=500))
+    embeddings = RateLimitedEmbeddings(provider, requests_per_minute=0)
+    with pytest.raises(RateLimitError, match="HTTP 500"):
+        embeddings.embed_documents(["a"])
+    assert provider.calls == 1
+    assert sleeps == []
+
+    provider = FlakyEmbeddings(*[RateLimitError() for _ in range(3)])
+    embeddings = RateLimitedEmbeddings(provider, requests_per_minute=0, max_retries=2, backoff=0.01)
+    with pytest.raises(RateLimitError, match="HTTP 429"):
+        embeddings.embed_documents(["a"])
+    assert provider.calls == 3
+    assert len(sleeps) == 2
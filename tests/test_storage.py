@@ -0,0 +1,77 @@
+import io
+import mmap
+
+import pytest
+
+from searchflow.db.storage import LocalStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalStore(str(tmp_path / "storage"))
+    store.create_bucket("project")
+    return store
+
+
+def test_upload_bytes_and_read_back_through_mmap(store, tmp_path):
+    store.upload("project", "docs/report.pdf", b"%PDF-1.7 content", "application/pdf")
+
+    data = store.read("project", "docs/report.pdf")
+    assert isinstance(data, mmap.mmap)
+    assert data[:] == b"%PDF-1.7 content"
+    data.close()
+    # Uploads are written to a temporary file and renamed, nothing is left next to the target
+    assert [path.name for path in (tmp_path / "storage" / "project" / "docs").iterdir()] == ["report.pdf"]
+
+
+def test_upload_stream_replaces_the_file(store):
+    store.upload("project", "notes.txt", b"old", "text/plain")
+    store.upload("project", "notes.txt", io.BytesIO(b"new " * 100_000), "text/plain")
+
+    data = store.read("project", "notes.txt")
+    assert len(data) == 400_000
+    assert data[:8] == b"new new "
+    data.close()
+
+
+def test_empty_files_are_read_as_bytes(store):
+    store.upload("project", "empty.txt", b"", "text/plain")
+
+    assert store.read("project", "empty.txt") == b""
+
+
+def test_remove(store):
+    store.upload("project", "a.txt", b"a", "text/plain")
+    store.upload("project", "b.txt", b"b", "text/plain")
+
+    store.remove("project", ["a.txt", "missing.txt"])
+
+    with pytest.raises(FileNotFoundError):
+        store.read("project", "a.txt")
+    assert store.read("project", "b.txt")[:] == b"b"
+
+    store.delete_bucket("project")
+    with pytest.raises(FileNotFoundError):
+        store.read("project", "b.txt")
+
+
+@pytest.mark.parametrize("bucket, path", [
+    ("project", "../other/file.txt"),
+    ("project", "docs/../../file.txt"),
+    ("project", "/etc/passwd"),
+    ("../project", "file.txt"),
+    ("project/docs", "file.txt"),
+])
+def test_path_traversal_is_rejected(store, bucket, path):
+    with pytest.raises(ValueError, match="Invalid storage path"):
+        store.upload(bucket, path, b"x", "text/plain")
+    with pytest.raises(ValueError, match="Invalid storage path"):
+        store.read(bucket, path)
+    with pytest.raises(ValueError, match="Invalid storage path"):
+        store.remove(bucket, [path])
+
+
+def test_no_download_urls(store):
+    store.upload("project", "a.txt", b"a", "text/plain")
+
+    assert store.sign_urls("project", ["a.txt"], expires_in=60) == {}